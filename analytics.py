@@ -0,0 +1,295 @@
+#!/usr/bin/python3
+
+import functools
+import logging
+import time
+from datetime import date, timedelta
+
+from log_archive import attach_archive, history_source
+
+logger = logging.getLogger(__name__)
+
+# Usage analytics. refresh_usage_rollups() folds new checkout_log rows into daily rollup
+# tables (see migration 8): checkouts per item, employee and hour by checkout day, and
+# completed loans (checkout followed by checkin) with their time out and late returns by
+# return day. The report_* functions read only the rollups.
+#
+#   python3 analytics.py        # refresh; run from cron, e.g. hourly
+
+# checkout_log rows paired and aggregated per transaction
+USAGE_CHUNK_ROWS = 500000
+
+# Default report window, in days
+REPORT_DAYS = 30
+
+CHECKOUT, CHECKIN, OTHER = 1, 2, 0
+
+DAY_SECONDS = 86400
+
+# NumPy, imported by the first refresh; the reports (and the web app importing them) don't need it
+np = None
+
+
+# Function to import NumPy on first use
+def load_numpy():
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            raise RuntimeError("Refreshing usage rollups needs NumPy (pip install numpy).") from None
+        np = numpy
+
+
+# Function to turn days since the epoch into 'YYYY-MM-DD' (a batch spans few distinct days)
+@functools.lru_cache(maxsize=4096)
+def day_string(day):
+    return (date(1970, 1, 1) + timedelta(days=day)).isoformat()
+
+
+# Function to number distinct values in order of appearance; returns (codes array, values list)
+# A dict pass is much faster than np.unique over Python strings
+def encode(values):
+    lookup = {}
+    codes = np.fromiter((lookup.setdefault(value, len(lookup)) for value in values), dtype=np.int64,
+                        count=len(values))
+    return codes, list(lookup)
+
+
+# Function to read one id range of the log, plus the open loans, as arrays sorted by item then time
+# Timestamps come back as seconds since the epoch of the local wall-clock time
+def load_events(conn, after, upto):
+    rows = conn.execute(f'''
+        SELECT id, barcode, action, checked_out_by,
+               IFNULL(CAST(strftime('%s', timestamp) AS INTEGER), -1),
+               IFNULL(CAST(strftime('%s', expected_return_date) AS INTEGER), -1)
+        FROM {history_source(conn, 'id > :after AND id <= :upto')}
+    ''', {'after': after, 'upto': upto}).fetchall()
+
+    # Open loans go in as checkouts ordered before anything in this range (id -1) and aren't counted again
+    open_loans = conn.execute('''
+        SELECT -1, barcode, 'open', employee_id, started_at, IFNULL(due_at, -1) FROM usage_open_loans
+    ''').fetchall()
+
+    columns = list(zip(*(open_loans + rows))) or [()] * 6
+    ids = np.array(columns[0], dtype=np.int64)
+    items, barcodes = encode(columns[1])
+    actions, action_names = encode(columns[2])
+    employees, employee_ids = encode(columns[3])
+    action_kinds = np.array([CHECKOUT if name in ('checkout', 'open') else CHECKIN if name == 'checkin' else OTHER
+                             for name in action_names], dtype=np.int64)
+
+    events = {
+        'item': items,
+        'employee': employees,
+        'action': action_kinds[actions] if len(actions) else actions,
+        'at': np.array(columns[4], dtype=np.int64),
+        'due': np.array(columns[5], dtype=np.int64),
+        'new': ids >= 0,
+    }
+    order = np.lexsort((ids, events['at'], items))
+    events = {key: values[order] for key, values in events.items()}
+    return events, barcodes, employee_ids, len(rows)
+
+
+# Function to pair each checkout with a directly following checkin of the same item
+# Returns (checkout index, checkin index) arrays and the indexes of checkouts still open
+def pair_loans(events):
+    item, action = events['item'], events['action']
+    same_item = item[1:] == item[:-1]
+    closes = same_item & (action[:-1] == CHECKOUT) & (action[1:] == CHECKIN)
+    starts = np.nonzero(closes)[0]
+
+    last_of_item = np.ones(len(item), dtype=bool)
+    last_of_item[:-1] = ~same_item
+    still_open = np.nonzero(last_of_item & (action == CHECKOUT))[0]
+    return starts, starts + 1, still_open
+
+
+# Function to total checkouts (by checkout day) and returned loans (by return day) per (day, key)
+# Groups on day * len(names) + key code, one np.unique for all four columns
+def daily_totals(names, checkout_keys, checkout_day, loan_keys, return_day, seconds_out, late):
+    width = max(len(names), 1)
+    grouped = np.concatenate((checkout_day * width + checkout_keys, return_day * width + loan_keys))
+    unique, inverse = np.unique(grouped, return_inverse=True)
+    split = len(checkout_keys)
+    totals = [np.bincount(inverse[:split], minlength=len(unique)),
+              np.bincount(inverse[split:], minlength=len(unique)),
+              np.bincount(inverse[split:], weights=seconds_out, minlength=len(unique)),
+              np.bincount(inverse[split:], weights=late, minlength=len(unique))]
+    return [(day_string(int(group // width)), names[group % width], *(int(column[index]) for column in totals))
+            for index, group in enumerate(unique)]
+
+
+# Function to aggregate one batch of events into rollup rows, all in vectorized passes
+# Returns (item rows, employee rows, hour rows, open loans) ready for write_rollups
+def aggregate(events, barcodes, employee_ids):
+    starts, ends, still_open = pair_loans(events)
+    at, due = events['at'], events['due']
+
+    # Checkouts, by checkout day (open loans carried in were counted when they started)
+    checkouts = np.nonzero((events['action'] == CHECKOUT) & events['new'])[0]
+    checkout_day = at[checkouts] // DAY_SECONDS
+
+    # Completed loans, by return day; late when returned after the due date's day
+    return_day = at[ends] // DAY_SECONDS
+    seconds_out = (at[ends] - at[starts]).astype(np.float64)
+    late = ((due[starts] >= 0) & (at[ends] >= due[starts] + DAY_SECONDS)).astype(np.float64)
+
+    item_rows = daily_totals(barcodes, events['item'][checkouts], checkout_day,
+                             events['item'][starts], return_day, seconds_out, late)
+    employee_rows = daily_totals(employee_ids, events['employee'][checkouts], checkout_day,
+                                 events['employee'][starts], return_day, seconds_out, late)
+
+    hours, counts = np.unique(at[checkouts] // 3600, return_counts=True)
+    hour_rows = [(day_string(int(hour // 24)), int(hour % 24), int(count)) for hour, count in zip(hours, counts)]
+
+    open_loans = [(barcodes[events['item'][index]], employee_ids[events['employee'][index]], int(at[index]),
+                   int(due[index]) if due[index] >= 0 else None) for index in still_open]
+    return item_rows, employee_rows, hour_rows, open_loans
+
+
+# Function to add one batch's rollup rows to the tables and replace the open loans
+def write_rollups(cursor, item_rows, employee_rows, hour_rows, open_loans):
+    for name, key, rows in (('items', 'barcode', item_rows), ('employees', 'employee_id', employee_rows)):
+        cursor.executemany(f'''
+            INSERT INTO usage_daily_{name} (day, {key}, checkouts, loans_returned, seconds_out, overdue_returns)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (day, {key}) DO UPDATE SET
+                checkouts = checkouts + excluded.checkouts,
+                loans_returned = loans_returned + excluded.loans_returned,
+                seconds_out = seconds_out + excluded.seconds_out,
+                overdue_returns = overdue_returns + excluded.overdue_returns
+        ''', rows)
+
+    cursor.executemany('''
+        INSERT INTO usage_daily_hours (day, hour, checkouts) VALUES (?, ?, ?)
+        ON CONFLICT (day, hour) DO UPDATE SET checkouts = checkouts + excluded.checkouts
+    ''', hour_rows)
+
+    cursor.execute('DELETE FROM usage_open_loans')
+    cursor.executemany('INSERT INTO usage_open_loans (barcode, employee_id, started_at, due_at) VALUES (?, ?, ?, ?)',
+                       open_loans)
+
+
+# Function to fold every checkout_log row added since the last refresh into the rollups
+# Each chunk of USAGE_CHUNK_ROWS ids commits with its watermark, so an interrupted refresh resumes
+# Returns the number of log rows processed
+def refresh_usage_rollups(conn, chunk_rows=USAGE_CHUNK_ROWS):
+    load_numpy()
+
+    last_id = conn.execute('SELECT MAX(id) FROM main.checkout_log').fetchone()[0] or 0
+    if attach_archive(conn):
+        last_id = max(last_id, conn.execute('SELECT MAX(id) FROM archive.checkout_log').fetchone()[0] or 0)
+
+    processed = 0
+    cursor = conn.cursor()
+    while True:
+        after = conn.execute("SELECT value FROM app_meta WHERE key = 'usage_log_id'").fetchone()[0]
+        if after >= last_id:
+            return processed
+
+        upto = min(after + chunk_rows, last_id)
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            events, barcodes, employee_ids, count = load_events(conn, after, upto)
+            write_rollups(cursor, *aggregate(events, barcodes, employee_ids))
+            cursor.execute("UPDATE app_meta SET value = ? WHERE key = 'usage_log_id'", (upto,))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        processed += count
+        logger.debug("Usage rollups: folded log ids %d-%d (%d rows).", after + 1, upto, count)
+
+
+# Function to resolve a report window; start and end are 'YYYY-MM-DD' strings or None
+# Raises ValueError on a malformed date
+def report_window(start=None, end=None):
+    end_day = date.fromisoformat(end) if end else date.today()
+    start_day = date.fromisoformat(start) if start else end_day - timedelta(days=REPORT_DAYS - 1)
+    if start_day > end_day:
+        raise ValueError("start is after end")
+    return start_day.isoformat(), end_day.isoformat(), (end_day - start_day).days + 1
+
+
+# Function to report the most-borrowed items with their time out and share of the window spent out
+# A loan's whole time out is booked on its return day, so utilization is approximate: a loan
+# longer than the window would count for more than all of it, and is capped at 1.0
+def report_items(conn, start=None, end=None, limit=50):
+    start, end, days = report_window(start, end)
+    return [dict(row) for row in conn.execute('''
+        SELECT u.barcode, i.description,
+               SUM(u.checkouts) AS checkouts, SUM(u.loans_returned) AS loans_returned,
+               SUM(u.seconds_out) AS seconds_out, SUM(u.overdue_returns) AS overdue_returns,
+               ROUND(MIN(SUM(u.seconds_out) * 1.0 / (:days * 86400), 1.0), 4) AS utilization
+        FROM usage_daily_items u
+        LEFT JOIN inventory i ON i.barcode = u.barcode
+        WHERE u.day BETWEEN :start AND :end
+        GROUP BY u.barcode
+        ORDER BY checkouts DESC, seconds_out DESC
+        LIMIT :limit
+    ''', {'start': start, 'end': end, 'days': days, 'limit': limit})]
+
+
+# Function to report borrowing per employee
+def report_employees(conn, start=None, end=None, limit=50):
+    start, end, _ = report_window(start, end)
+    return [dict(row) for row in conn.execute('''
+        SELECT u.employee_id, e.name,
+               SUM(u.checkouts) AS checkouts, SUM(u.loans_returned) AS loans_returned,
+               SUM(u.seconds_out) AS seconds_out, SUM(u.overdue_returns) AS overdue_returns
+        FROM usage_daily_employees u
+        LEFT JOIN employees e ON e.id = u.employee_id
+        WHERE u.day BETWEEN :start AND :end
+        GROUP BY u.employee_id
+        ORDER BY checkouts DESC
+        LIMIT :limit
+    ''', {'start': start, 'end': end, 'limit': limit})]
+
+
+# Function to report late returns per day, and the items overdue right now
+# Loans checked out before due dates were logged count as on time
+def report_overdue(conn, start=None, end=None):
+    start, end, _ = report_window(start, end)
+    days = [dict(row) for row in conn.execute('''
+        SELECT day, SUM(loans_returned) AS loans_returned, SUM(overdue_returns) AS overdue_returns,
+               ROUND(SUM(overdue_returns) * 1.0 / MAX(SUM(loans_returned), 1), 4) AS overdue_rate
+        FROM usage_daily_items
+        WHERE day BETWEEN :start AND :end
+        GROUP BY day
+        ORDER BY day
+    ''', {'start': start, 'end': end})]
+    currently_overdue = conn.execute(
+        "SELECT COUNT(*) FROM inventory WHERE status = 'out' AND expected_return_date < DATE('now')").fetchone()[0]
+    return {'days': days, 'currently_overdue': currently_overdue}
+
+
+# Function to report checkouts by hour of day and by weekday (0 = Sunday)
+def report_peak_hours(conn, start=None, end=None):
+    start, end, _ = report_window(start, end)
+    params = {'start': start, 'end': end}
+    hours = conn.execute('''
+        SELECT hour, SUM(checkouts) AS checkouts FROM usage_daily_hours
+        WHERE day BETWEEN :start AND :end GROUP BY hour ORDER BY hour
+    ''', params).fetchall()
+    weekdays = conn.execute('''
+        SELECT CAST(strftime('%w', day) AS INTEGER) AS weekday, SUM(checkouts) AS checkouts FROM usage_daily_hours
+        WHERE day BETWEEN :start AND :end GROUP BY weekday ORDER BY weekday
+    ''', params).fetchall()
+    return {'hours': [dict(row) for row in hours], 'weekdays': [dict(row) for row in weekdays]}
+
+
+if __name__ == "__main__":
+    from app_logging import configure_logging
+    from db import connect
+    from migrations import migrate
+
+    configure_logging()
+    conn = connect()
+    migrate(conn)
+
+    start = time.perf_counter()
+    count = refresh_usage_rollups(conn)
+    print(f"Folded {count} checkout_log rows into the usage rollups in {time.perf_counter() - start:.1f}s.")
+    conn.close()
@@ -1,294 +1,213 @@
-import sqlite3
-import subprocess
-import evdev
+import os
+
+# Server concurrency: 'threading' (the default) runs a thread per connection; 'gevent' serves
+# hundreds of dashboard clients from one process on greenlets (pip install gevent gevent-websocket).
+# gevent has to patch the standard library before anything else imports it, so start the server
+# with `python3 app.py` rather than importing this module from another program.
+SOCKETIO_ASYNC_MODE = os.getenv('SOCKETIO_ASYNC_MODE', 'threading')
+if SOCKETIO_ASYNC_MODE == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+
+import functools
+import logging
 import time
-from flask import Flask, render_template, request, jsonify, redirect, url_for
-from flask_socketio import SocketIO, emit
+from flask import Flask, render_template, request, jsonify, redirect, url_for, g, copy_current_request_context
+from flask_socketio import SocketIO
 import threading
-from email_notifications import send_notification
 from datetime import datetime
+from db import get_db_connection, release_db_connection, run_db
+from broadcaster import Broadcaster
+from message_bus import get_message_bus, MESSAGE_BUS
+from app_logging import configure_logging
+from inventory_core import (initialize_database, log_item_action, get_inventory_page,
+                            encode_inventory_cursor, decode_inventory_cursor, INVENTORY_SORT_KEYS,
+                            INVENTORY_FILTERS, INVENTORY_PAGE_SIZE, INVENTORY_MAX_PAGE_SIZE)
+from metrics import Counter, Histogram, CallbackMetric, render as render_metrics
+from employee_directory import get_directory, search_directory
+from item_cache import ItemStateCache
+from item_search import search_items, SEARCH_LIMIT, SEARCH_MAX_LIMIT
+from log_archive import get_item_history, get_item_summary
+import analytics
+from scan_pipeline import ScanPipeline, Scan
+from scan_service import ScanIngestor, publish_item_changed, invalidate_on_change
+
+configure_logging()
+logger = logging.getLogger(__name__)
 
 # Initialize Flask app and SocketIO
 app = Flask(__name__)
-socketio = SocketIO(app)
+socketio = SocketIO(app, async_mode=SOCKETIO_ASYNC_MODE)
 
+# In-memory barcode -> item state, written through by every code path that changes an item
+item_cache = ItemStateCache()
 
+# Carries item changes, scans and cache invalidations to every process (see message_bus.py)
+# It also numbers item changes: clients apply `item_changed` deltas in version order and
+# resync when they see a gap
+message_bus = get_message_bus()
 
+# Whether this process reads the scanners ('app') or scan_service.py does ('separate'),
+# which lets several web workers run side by side on the outbox bus
+SCANNER_PROCESS = os.getenv('SCANNER_PROCESS', 'app')
+
+# Port the web server listens on; give each web worker its own behind a proxy with sticky sessions
+PORT = int(os.getenv('PORT', '5000'))
+
+# Latency metrics, scraped from /metrics (SQL statement timings live in db.py)
+HTTP_REQUEST_SECONDS = Histogram('inventory_http_request_duration_seconds', 'Time to handle an HTTP request',
+                                 ['route', 'method', 'status'])
+SOCKETIO_EVENT_SECONDS = Histogram('inventory_socketio_event_duration_seconds', 'Time to handle a SocketIO event',
+                                   ['event'])
+SOCKETIO_EVENT_ERRORS = Counter('inventory_socketio_event_errors_total', 'SocketIO events whose handler raised',
+                                ['event'])
+BROADCAST_SECONDS = Histogram('inventory_broadcast_duration_seconds', 'Time to emit a broadcast to all clients',
+                              ['event'])
+
+
+# Function to emit one queued broadcast to every client (runs on the broadcaster's sender task)
+def emit_broadcast(event, payload):
+    with BROADCAST_SECONDS.time(event=event):
+        socketio.emit(event, payload)
 
-# Function to check if the inventory table exists
-def initialize_database():
-    conn = sqlite3.connect('inventory.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='inventory';")
-    table_exists = cursor.fetchone()
-    if table_exists is None:
-        print("Table 'inventory' does not exist. Running setup_database.py...")
-        try:
-            subprocess.run(['python3', 'setup_database.py'], check=True)
-            print("setup_database.py executed successfully.")
-        except subprocess.CalledProcessError as e:
-            print(f"Error running setup_database.py: {e}")
-    else:
-        print("Table 'inventory' already exists.")
-    conn.close()
 
+# Every server-wide push goes through this queue, so handlers never wait on the fan-out
+broadcaster = Broadcaster(emit_broadcast, socketio.start_background_task)
 
 
-# Initialize the database
+# Function to take an event off the bus: refresh the item cache if another process changed
+# the item, then queue the event for this process's clients
+def handle_bus_message(event, payload, remote):
+    invalidate_on_change(item_cache, event, payload, remote)
+    if event != 'invalidate_items':
+        broadcaster.publish(event, payload)
+
+
+message_bus.subscribe(handle_bus_message)
+
+
+# Create or upgrade the schema before serving (in-process; see migrations.py)
 initialize_database()
 
 
+# Connections are per-thread and pooled (see db.py); hand them back after every request and socket event
+app.teardown_appcontext(release_db_connection)
 
-# Connect to SQLite database globally
-def get_db_connection():
-    conn = sqlite3.connect('inventory.db')
-    conn.row_factory = sqlite3.Row
-    return conn
 
+# Time every HTTP request, labelled by route pattern (not the raw path) to keep the label set small
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
 
 
-# Function to get all inventory data
-def get_inventory_data():
-    conn = get_db_connection()
-    cursor = conn.cursor()
+@app.after_request
+def record_request_time(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, route=route, method=request.method,
+                                     status=response.status_code)
+    return response
 
-    # Fetch all inventory data and latest checkout information
-    items = cursor.execute(''' 
-        SELECT 
-            i.barcode, 
-            i.status, 
-            l.checked_out_by, 
-            l.timestamp AS checkout_timestamp,
-            i.expected_return_date  -- Include expected return date
-        FROM inventory i
-        LEFT JOIN (
-            SELECT barcode, checked_out_by, timestamp
-            FROM checkout_log
-            WHERE timestamp = (
-                SELECT MAX(timestamp)
-                FROM checkout_log AS sublog
-                WHERE sublog.barcode = checkout_log.barcode
-            )
-        ) l ON i.barcode = l.barcode
-    ''').fetchall()
- # Debug: Log fetched items
-    print("DEBUG: Fetched items from the database:")
-    for item in items:
-        print({
-            'barcode': item['barcode'],
-            'status': item['status'],
-            'checked_out_by': item['checked_out_by'],
-            'checkout_timestamp': item['checkout_timestamp'],
-            'expected_return_date': item['expected_return_date']
-        })
-    # Create a list to hold the inventory state
-    inventory = []
 
-    for item in items:
-        inventory.append({
-            'barcode': item['barcode'],
-            'status': item['status'],
-            'checked_out_by': item['checked_out_by'] or 'N/A',
-            'checkout_timestamp': item['checkout_timestamp'] or 'N/A',
-            'expected_return_date': item['expected_return_date'] or 'N/A'  # Include expected return date
-        })
+# Decorator to time a SocketIO handler; goes below @socketio.on
+def timed_event(event):
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return handler(*args, **kwargs)
+            except Exception:
+                SOCKETIO_EVENT_ERRORS.inc(event=event)
+                raise
+            finally:
+                SOCKETIO_EVENT_SECONDS.observe(time.perf_counter() - start, event=event)
+        return wrapper
+    return decorator
 
-    conn.close()
-    return {'items': inventory}
-
-# Function to process barcode scan
-
-
-
-
-""" #OLD
-# Function to process barcode scan
-def process_barcode(scanner):
-    barcode = ''
-    print("DEBUG: Starting barcode processing...")
-
-    for event in scanner.read_loop():
-        if event.type == evdev.ecodes.EV_KEY:
-            key_event = evdev.categorize(event)
-            if key_event.keystate == key_event.key_down:
-                key = evdev.ecodes.KEY[key_event.scancode]
-                
-                # When 'Enter' key is detected, barcode is complete
-                if key == 'KEY_ENTER':
-                    print(f"DEBUG: Barcode scanned: {barcode}")
-                    
-                    # Check if the item already exists in the inventory
-                    conn = get_db_connection()
-                    cursor = conn.cursor()
-                    item = cursor.execute('SELECT * FROM inventory WHERE barcode = ?', (barcode,)).fetchone()
-                    conn.close()
-
-                    if item:
-                        # If the item exists, emit barcode to client-side to trigger the modal
-                        socketio.emit('barcode_scanned', {'barcode': barcode})
-                    else:
-                        # If the item doesn't exist, create it with default values
-                        print(f"DEBUG: Creating new item in inventory: {barcode}")
-                        conn = get_db_connection()
-                        cursor = conn.cursor()
-                        cursor.execute('INSERT INTO inventory (barcode, status, checked_out_by, expected_return_date) VALUES (?, ?, ?, ?)', 
-                                       (barcode, 'in', 'system', 'N/A'))
-                        conn.commit()
-                        conn.close()
-                        print(f"DEBUG: New item {barcode} added to inventory.")
-
-                    barcode = ''  # Reset for the next scan
-                else:
-                    # Add key to barcode string
-                    barcode += key[-1]
-"""
-
-# Function to process barcode scan
-def process_barcode(scanner):
-    barcode = ''
-    print("DEBUG: Starting barcode processing...")
-
-    for event in scanner.read_loop():
-        if event.type == evdev.ecodes.EV_KEY:
-            key_event = evdev.categorize(event)
-            if key_event.keystate == key_event.key_down:
-                key = evdev.ecodes.KEY[key_event.scancode]
-
-                
-
-                # Ignore the Shift keys
-                if key in ['KEY_LEFTSHIFT', 'KEY_RIGHTSHIFT']:
-                    continue
-
-                # When 'Enter' key is detected, barcode is complete
-                if key == 'KEY_ENTER':
-                    
-
-                    # Check if the item already exists in the inventory
-                    conn = get_db_connection()
-                    cursor = conn.cursor()
-                    item = cursor.execute('SELECT * FROM inventory WHERE barcode = ?', (barcode,)).fetchone()
-                    conn.close()
-
-                    if item:
-                        # If the item exists, emit barcode to client-side to trigger the modal
-                        socketio.emit('barcode_scanned', {'barcode': barcode})
-                    else:
-                        # If the item doesn't exist, create it with default values
-                        print(f"DEBUG: Creating new item in inventory: {barcode}")
-                        conn = get_db_connection()
-                        cursor = conn.cursor()
-                        cursor.execute(
-                            'INSERT INTO inventory (barcode, status, checked_out_by, expected_return_date) VALUES (?, ?, ?, ?)', 
-                            (barcode, 'in', 'system', 'N/A')
-                        )
-                        conn.commit()
-                        conn.close()
-                        print(f"DEBUG: New item {barcode} added to inventory.")
-
-                    # Reset the barcode string for the next scan
-                    barcode = ''
-
-                else:
-                    # Convert key name to the actual character
-                    char = None
-                    if key.startswith('KEY_'):
-                        # Remove 'KEY_' prefix to get the character
-                        char = key.split('KEY_')[-1].lower()
-                        if len(char) == 1:  # If it's a single character
-                            barcode += char
-                            print(f"DEBUG: Updated barcode: {barcode}")
-
-
-
-
-
-
-
-
-
-# Function to toggle the state of an item
-def toggle_item_state(barcode, checked_out_by, expected_return_date=None):
-    conn = get_db_connection()
-    cursor = conn.cursor()
 
-    # Check if the item already exists in the inventory
-    item = cursor.execute('SELECT * FROM inventory WHERE barcode = ?', (barcode,)).fetchone()
+# Decorator to run a view on the database executor (see db.run_db) with its request context,
+# so a slow query holds one executor worker rather than the server's event loop
+def db_view(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        return run_db(copy_current_request_context(view), *args, **kwargs)
+    return wrapper
 
-    if item:
-        # If the item exists, toggle the status
-        new_status = 'out' if item['status'] == 'in' else 'in'
-
-        if new_status == 'out':
-            # When checking out, ensure the expected return date is provided
-            if not expected_return_date:
-                print("Expected return date is required for check-out.")
-                return  # Exit if no return date is provided
-            
-            # Insert the action into the checkout_log for checkout
-            action = 'checkout'
-            timestamp = time.strftime('%Y-%m-%d %H:%M:%S')
-            cursor.execute('INSERT INTO checkout_log (barcode, action, checked_out_by, timestamp) VALUES (?, ?, ?, ?)',
-                           (barcode, action, checked_out_by, timestamp))
-
-        else:
-            # When checking in, clear the expected return date
-            expected_return_date = None  # Clear return date when checking in
-            action = 'checkin'
-            timestamp = time.strftime('%Y-%m-%d %H:%M:%S')
-            cursor.execute('INSERT INTO checkout_log (barcode, action, checked_out_by, timestamp) VALUES (?, ?, ?, ?)',
-                           (barcode, action, checked_out_by, timestamp))
-    
-    else:
-        # If the item does not exist, it means it's a new entry (create action)
-        new_status = 'in'  # Mark the new item as 'in'
-        action = 'create'
-        
-        # Insert the new item into the inventory table with status 'in'
-        cursor.execute('INSERT INTO inventory (barcode, status, checked_out_by, expected_return_date) VALUES (?, ?, ?, ?)', 
-                       (barcode, new_status, checked_out_by, expected_return_date))
-
-        # Insert the action into the checkout_log for create
-        timestamp = time.strftime('%Y-%m-%d %H:%M:%S')
-        cursor.execute('INSERT INTO checkout_log (barcode, action, checked_out_by, timestamp) VALUES (?, ?, ?, ?)',
-                       (barcode, action, 'system', timestamp))
-
-        # Emit a `new_item` event to the frontend
-        socketio.emit('new_item', {
-            'barcode': barcode,
-            'status': 'in',
-            'checked_out_by': 'system',
-            'expected_return_date': expected_return_date or 'N/A'
-        })
-        print(f"DEBUG: New item {barcode} added to inventory.")
 
-    # Update the inventory table with the new status, checked out by, and expected return date
-    cursor.execute('UPDATE inventory SET status = ?, checked_out_by = ?, checkout_timestamp = ?, expected_return_date = ? WHERE barcode = ?', 
-                   (new_status, checked_out_by, timestamp, expected_return_date, barcode))
+# Writes scans and publishes their events, for hardware scanners and the `scan` socket event alike
+scan_ingestor = ScanIngestor(item_cache, message_bus)
+
+# The scanner hub feeds this; the writer thread is started in __main__
+scan_pipeline = ScanPipeline(scan_ingestor.ingest)
+
+
+# Expose the pipeline and item cache counters alongside the latency histograms
+def scan_metric(key):
+    return lambda: scan_pipeline.get_metrics()[key]
 
-    conn.commit()
-    conn.close()
 
+def cache_metric(key):
+    return lambda: item_cache.get_metrics()[key]
 
 
+def broadcast_metric(key):
+    return lambda: broadcaster.get_metrics()[key]
 
 
+def bus_metric(key):
+    return lambda: message_bus.get_metrics()[key]
 
 
+CallbackMetric('inventory_scan_queue_depth', 'Scans waiting for the writer', scan_metric('queue_depth'))
+CallbackMetric('inventory_scan_queue_capacity', 'Scan queue size limit', scan_metric('queue_capacity'))
+CallbackMetric('inventory_scans_submitted_total', 'Scans read from scanners',
+               lambda: {(station or '',): count for station, count in scan_pipeline.get_metrics()['scans_by_station'].items()},
+               ['station'], kind='counter')
+CallbackMetric('inventory_scans_processed_total', 'Scans written and emitted', scan_metric('scans_processed'), kind='counter')
+CallbackMetric('inventory_scan_batches_total', 'Writer transactions', scan_metric('batches'), kind='counter')
+CallbackMetric('inventory_scan_batch_errors_total', 'Scan batches that failed', scan_metric('errors'), kind='counter')
+CallbackMetric('inventory_scan_backpressure_waits_total', 'Times a reader waited on a full scan queue',
+               scan_metric('backpressure_waits'), kind='counter')
+CallbackMetric('inventory_item_cache_size', 'Items held in the item state cache', cache_metric('size'))
+CallbackMetric('inventory_item_cache_hits_total', 'Item state cache hits', cache_metric('hits'), kind='counter')
+CallbackMetric('inventory_item_cache_misses_total', 'Item state cache misses', cache_metric('misses'), kind='counter')
+CallbackMetric('inventory_item_cache_evictions_total', 'Item state cache evictions', cache_metric('evictions'), kind='counter')
+CallbackMetric('inventory_broadcast_queue_depth', 'Broadcasts waiting for the sender', broadcast_metric('queue_depth'))
+CallbackMetric('inventory_broadcasts_published_total', 'Broadcasts queued', broadcast_metric('published'), kind='counter')
+CallbackMetric('inventory_broadcast_errors_total', 'Broadcasts whose emit raised', broadcast_metric('errors'), kind='counter')
+CallbackMetric('inventory_bus_events_published_total', 'Events this process published on the message bus',
+               bus_metric('published'), kind='counter')
+CallbackMetric('inventory_bus_events_delivered_total', 'Events from every process delivered here by the message bus',
+               bus_metric('delivered'), kind='counter')
+
 
 
 # WebSocket event for handling barcode scans
 @socketio.on('scan')
+@timed_event('scan')
 def handle_scan(barcode):
-    print(f"DEBUG: Received scan for barcode: {barcode}")
-    toggle_item_state(barcode)
+    logger.debug("Received scan for barcode: %s", barcode)
+    # Same as a hardware scan: a new barcode is created, a known one opens the modal on every kiosk.
+    # Ingested directly rather than queued, since the writer may be in scan_service.py
+    scan_ingestor.ingest([Scan(barcode, None, time.monotonic())])
 
 
 
 
 # WebSocket event for handling name submission
 @socketio.on('submit_name')
+@timed_event('submit_name')
 def handle_name_submission(data):
+    run_db(record_name_submission, data)
+
+    # Push only the changed row to all connected clients
+    broadcast_item_changed(data['barcode'])
+
+
+# Function to apply a checkout/check-in submitted from the modal
+def record_name_submission(data):
     barcode = data['barcode']
     employee_id = data['employee_id']
     expected_return_date = data.get('expected_return_date')  # Get expected return date
@@ -316,10 +235,10 @@ def handle_name_submission(data):
         
         # Log the checkout or check-in action in the checkout_log
         action = 'checkout' if new_status == 'out' else 'checkin'
-        cursor.execute('INSERT INTO checkout_log (barcode, action, checked_out_by, timestamp) VALUES (?, ?, ?, ?)', 
-                       (barcode, action, employee_id, checkout_timestamp))
+        log_item_action(cursor, barcode, action, employee_id, checkout_timestamp, expected_return_date)
 
-        print(f"DEBUG: Updated item {barcode}: new_status={new_status}, checked_out_by={employee_id}, expected_return_date={expected_return_date}, checkout_timestamp={checkout_timestamp}")
+        logger.debug("Updated item %s: new_status=%s, checked_out_by=%s, expected_return_date=%s, checkout_timestamp=%s",
+                     barcode, new_status, employee_id, expected_return_date, checkout_timestamp)
 
     else:
         # If the item does not exist, create it with default values
@@ -328,17 +247,17 @@ def handle_name_submission(data):
         
         # Log the creation action in the checkout_log
         action = 'create'
-        cursor.execute('INSERT INTO checkout_log (barcode, action, checked_out_by, timestamp) VALUES (?, ?, ?, ?)', 
-                       (barcode, action, 'system', checkout_timestamp))
-        print(f"DEBUG: New item {barcode} added to inventory with status 'in'.")
+        log_item_action(cursor, barcode, action, 'system', checkout_timestamp)
+        logger.debug("New item %s added to inventory with status 'in'.", barcode)
+        new_status = 'in'
 
-    # Commit the transaction and close the connection
+    # Commit the transaction
     conn.commit()
-    conn.close()
-
-    # Emit the updated inventory to all connected clients
-    emit('update_inventory', get_inventory_data(), broadcast=True)
 
+    # Write the new state through to the item cache
+    item_cache.put(barcode, {'barcode': barcode, 'status': new_status, 'checked_out_by': employee_id,
+                             'expected_return_date': expected_return_date if new_status == 'out' or not item else None,
+                             'description': item['description'] if item else None})
 
 
 
@@ -348,61 +267,63 @@ def handle_name_submission(data):
 
 # Flask route to display inventory
 @app.route('/')
+@db_view
 def inventory():
-    conn = get_db_connection()
-    
-    # Query to get the most recent checkout_log entry for each barcode, including employee names
-    items = conn.execute(''' 
-        SELECT i.id, 
-                i.description,
-               i.barcode, 
-               i.status, 
-               e.name AS checked_out_by,  -- Get employee name instead of ID
-               l.timestamp, 
-               i.expected_return_date  -- Include expected return date
-        FROM inventory i
-        LEFT JOIN (
-            SELECT barcode, checked_out_by, timestamp
-            FROM checkout_log
-            WHERE timestamp = (
-                SELECT MAX(timestamp)
-                FROM checkout_log AS sublog
-                WHERE sublog.barcode = checkout_log.barcode
-            )
-        ) l ON i.barcode = l.barcode
-        LEFT JOIN employees e ON l.checked_out_by = e.id  -- Join with employees table to get employee name
-        ORDER BY l.timestamp DESC;
-    ''').fetchall()
-
-    # Convert items from sqlite3.Row to a list of dictionaries
-    items_list = []
-    for item in items:
-        items_list.append({
-            'id': item['id'],
-            'description' : item['description'],
-            'barcode': item['barcode'],
-            'status': item['status'],
-            'checked_out_by': item['checked_out_by'] if item['checked_out_by'] else 'N/A',  # Handle NULL values
-            'timestamp': item['timestamp'],
-            'expected_return_date': item['expected_return_date']  # Include expected return date
-        })
+    # Render only the first screen; the page fetches further rows from /get_inventory as it scrolls
+    page = get_versioned_inventory_page()
+    return render_template('inventory.html', items=page['items'], next_cursor=page['next_cursor'],
+                           version=page['version'])
 
-    conn.close()
-    
-    # Print the items for debugging
-    print("DEBUG: Items fetched from database:", items_list)
 
-    return render_template('inventory.html', items=items_list)
+
+# Route to GET one page of the inventory as JSON (sorted, filtered, cursor-paginated)
+@app.route('/get_inventory', methods=['GET'])
+@db_view
+def get_inventory():
+    sort = request.args.get('sort', 'timestamp')
+    order = request.args.get('order', 'desc')
+    status_filter = request.args.get('filter', 'all')
+
+    if sort not in INVENTORY_SORT_KEYS or status_filter not in INVENTORY_FILTERS or order not in ('asc', 'desc'):
+        return jsonify({'error': 'Invalid sort, order or filter'}), 400
+
+    try:
+        limit = min(max(int(request.args.get('limit', INVENTORY_PAGE_SIZE)), 1), INVENTORY_MAX_PAGE_SIZE)
+        cursor = decode_inventory_cursor(request.args.get('cursor'))
+    except ValueError:
+        return jsonify({'error': 'Invalid limit or cursor'}), 400
+
+    return jsonify(get_versioned_inventory_page(sort, order, status_filter, limit, cursor))
+
+
+
+# Route to GET scan pipeline metrics (queue depth, throughput, scan-to-emit latency)
+@app.route('/get_scan_metrics', methods=['GET'])
+def get_scan_metrics():
+    return jsonify(scan_pipeline.get_metrics())
+
+
+
+# Route to GET every metric in the Prometheus text format
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return app.response_class(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+
+
+# Route to GET item cache hit/miss counters
+@app.route('/get_cache_metrics', methods=['GET'])
+def get_cache_metrics():
+    return jsonify(item_cache.get_metrics())
 
 
 
 # Route to GET item Status
 @app.route('/get_item_status', methods=['GET'])
+@db_view
 def get_item_status():
     barcode = request.args.get('barcode')
-    conn = get_db_connection()
-    item = conn.execute('SELECT * FROM inventory WHERE barcode = ?', (barcode,)).fetchone()
-    conn.close()
+    item = item_cache.get(get_db_connection(), barcode)
 
     if item:
         return jsonify({
@@ -415,115 +336,165 @@ def get_item_status():
         return jsonify({'status': 'new_item'}), 200  # Indicate it's a new item and skip status lookup
 
 
+# Route to GET items matching ?q= by barcode, description or holder name (word prefixes), best first
+@app.route('/items/search', methods=['GET'])
+@db_view
+def get_item_search():
+    try:
+        limit = min(max(int(request.args.get('limit', SEARCH_LIMIT)), 1), SEARCH_MAX_LIMIT)
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+
+    query = request.args.get('q', '')
+    items = search_items(get_db_connection(), query, limit)
+    for item in items:
+        item['checked_out_by'] = item['checked_out_by'] or 'N/A'
+    return jsonify({'query': query, 'items': items})
+
+
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 500
+
+
+# Route to GET one page of an item's check-in/out history, newest first, across the hot log and
+# the archive; pass the returned next_cursor as ?cursor= for the following page
+@app.route('/items/<barcode>/history', methods=['GET'])
+@db_view
+def get_item_history_page(barcode):
+    try:
+        limit = min(max(int(request.args.get('limit', HISTORY_PAGE_SIZE)), 1), HISTORY_MAX_PAGE_SIZE)
+        cursor = decode_inventory_cursor(request.args.get('cursor'))
+    except ValueError:
+        return jsonify({'error': 'Invalid limit or cursor'}), 400
+
+    conn = get_db_connection()
+    summary = get_item_summary(conn, barcode)
+    if summary is None and item_cache.get(conn, barcode) is None:
+        return jsonify({'error': f'Unknown item {barcode}'}), 404
+
+    # One extra row tells us whether another page exists
+    events = get_item_history(conn, barcode, limit + 1, cursor)
+    next_cursor = None
+    if len(events) > limit:
+        events = events[:limit]
+        next_cursor = encode_inventory_cursor(events[-1]['timestamp'], events[-1]['id'])
+
+    return jsonify({
+        'barcode': barcode,
+        'summary': summary,
+        'events': [{
+            'action': event['action'],
+            'timestamp': event['timestamp'],
+            'employee': event['checked_out_by_name'] or event['checked_out_by']  # 'system', or an id no longer in employees
+        } for event in events],
+        'next_cursor': next_cursor
+    })
+
+
+REPORTS = {
+    'items': analytics.report_items,
+    'employees': analytics.report_employees,
+    'overdue': analytics.report_overdue,
+    'peak-hours': analytics.report_peak_hours,
+}
+
+
+# Route to GET a usage report from the daily rollups (refreshed by analytics.py)
+# ?start=YYYY-MM-DD&end=YYYY-MM-DD, defaulting to the last 30 days
+@app.route('/reports/<name>', methods=['GET'])
+@db_view
+def get_report(name):
+    if name not in REPORTS:
+        return jsonify({'error': f'Unknown report {name}'}), 404
+    start, end = request.args.get('start'), request.args.get('end')
+    try:
+        report = REPORTS[name](get_db_connection(), start, end)
+    except ValueError:
+        return jsonify({'error': 'start and end must be YYYY-MM-DD dates, start first'}), 400
+    start, end, _ = analytics.report_window(start, end)
+    return jsonify({'report': name, 'start': start, 'end': end, 'data': report})
+
+
 # Route to get employee names and emails for the dropdown
+# Without ?q= it returns the full active directory; with ?q=<prefix>&page=<n> it returns one page
+# of Select2 search results. Both come from the in-process directory cache and carry an ETag,
+# so a repeat request with If-None-Match gets a 304
 @app.route('/get_employees', methods=['GET'])
+@db_view
 def get_employees():
     conn = get_db_connection()
-    employees = conn.execute('SELECT id, name, email, active FROM employees').fetchall()
-    conn.close()
-    
-    # Format data for Select2: id, text, and active status
-    employee_list = [{'id': emp['id'], 'text': f"{emp['name']} ({emp['email']})", 'active': emp['active']} for emp in employees]
-    return jsonify(employee_list)
+    query = request.args.get('q')
 
+    if query is None:
+        directory = get_directory(conn)
+        response = app.response_class(directory['json'], mimetype='application/json')
+        response.set_etag(directory['etag'])
+    else:
+        response = jsonify(search_directory(conn, query, request.args.get('page', 1, type=int)))
+        response.add_etag()
 
-def get_inventory_data():
-    conn = get_db_connection()
-    
-    items = conn.execute('''
-        SELECT 
-            i.description,
-            i.barcode, 
-            i.status, 
-            e.name AS checked_out_by,  -- Get employee name instead of ID
-            l.timestamp AS checkout_timestamp,
-            i.expected_return_date  -- Include expected return date
-        FROM 
-            inventory i
-        LEFT JOIN 
-            checkout_log l ON i.barcode = l.barcode
-        LEFT JOIN 
-            employees e ON l.checked_out_by = e.id  -- Join with employees table to get employee name
-        WHERE 
-            l.timestamp = (
-                SELECT MAX(timestamp) 
-                FROM checkout_log AS sublog 
-                WHERE sublog.barcode = l.barcode
-            )
-    ''').fetchall()
-    
-    # Debug: Print raw items fetched from the database
-    print("DEBUG: Raw items fetched from database:")
-    for item in items:
-        print(dict(item))  # Convert each Row object to a dictionary for clearer output
+    # Let the browser keep the response but revalidate it every time
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
 
-    # Convert to a list of dictionaries for easier manipulation on the client
-    inventory_items = []
-    for item in items:
-        inventory_items.append({
-            'barcode': item['barcode'],
-            'description': item['description'],
-            'status': item['status'],
-            'checked_out_by': item['checked_out_by'] if item['checked_out_by'] else 'N/A',  # Handle NULL values
-            'checkout_timestamp': item['checkout_timestamp'] if item['checkout_timestamp'] else 'N/A',  # Handle NULL values
-            'expected_return_date': item['expected_return_date'] if item['expected_return_date'] else 'N/A'  # Handle NULL values
-        })
-    
-    # Debug: Print the structured inventory items
-    print("DEBUG: Structured inventory items:", inventory_items)
 
-    conn.close()
-    return {'items': inventory_items}  # Return as a dictionary with 'items' key for consistency
+# Function to get a page of inventory tagged with the inventory version it reflects
+def get_versioned_inventory_page(*args):
+    # Read the version before the rows so a concurrent change is re-applied, never missed
+    version = message_bus.get_version(get_db_connection())
+    page = get_inventory_page(*args)
+    page['version'] = version
+    return page
 
 
+# Function to push a single changed item to every client, in every process, as a versioned delta
+# The emit itself happens on each process's broadcaster sender
+def broadcast_item_changed(barcode):
+    publish_item_changed(message_bus, barcode)
 
 
-# Function to check if items are overdue and send an email
-def check_overdue_items():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Query to get overdue items and the email of the person who checked them out
-    overdue_items = cursor.execute('''
-        SELECT i.barcode, i.expected_return_date, e.email
-        FROM inventory i
-        JOIN employees e ON i.checked_out_by = e.id
-        WHERE i.status = 'out' 
-        AND i.expected_return_date IS NOT NULL 
-        AND DATE(i.expected_return_date) < DATE('now')
-    ''').fetchall()
-    
-    for item in overdue_items:
-        barcode = item['barcode']
-        expected_return_date = item['expected_return_date']
-        email = item['email']
 
-        # Send email notification for overdue item
-        send_notification(barcode, expected_return_date, email)
-    
-    conn.close()
 
+# Function to serve the app from gevent's WSGI server (SOCKETIO_ASYNC_MODE=gevent)
+# The listener sets TCP_NODELAY, which accepted connections inherit: gevent writes a response's
+# headers and body separately, and with Nagle on every keep-alive response waits ~40ms for an ACK
+def serve_gevent(host, port):
+    import socket
+    from gevent import pywsgi
+    try:
+        from geventwebsocket.handler import WebSocketHandler as handler_class
+    except ImportError:
+        handler_class = pywsgi.WSGIHandler  # WebSockets then come from simple-websocket
+
+    listener = socket.create_server((host, port), backlog=1024)
+    listener.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    pywsgi.WSGIServer(listener, app, handler_class=handler_class, log=None).serve_forever()
 
 
 # Main execution flow
 if __name__ == "__main__":
-    # Detect barcode scanner
-    devices = [evdev.InputDevice(path) for path in evdev.list_devices()]
-    scanner = None
-
-    # Assign the correct device for the scanner
-    for device in devices:
-        print(f"Device found: {device.path} {device.name}")
-        if device.path == '/dev/input/event3':  # Adjust if needed
-            scanner = evdev.InputDevice(device.path)
-            break
-
-    if not scanner:
-        raise Exception("No barcode scanner found!")
-
-    # Start the barcode processing in a separate thread
-    threading.Thread(target=process_barcode, args=(scanner,), daemon=True).start()
+    # Preload the most recently active items so the first scans are memory reads
+    logger.info("Warmed item cache with %d items.", item_cache.warm(get_db_connection()))
+    release_db_connection()
+
+    # Start delivering events published by the other processes (a no-op on the local bus)
+    message_bus.start(socketio.start_background_task, socketio.sleep)
+
+    if SCANNER_PROCESS == 'separate':
+        if MESSAGE_BUS == 'local':
+            raise SystemExit("SCANNER_PROCESS=separate needs MESSAGE_BUS=outbox to hear about scans.")
+        logger.info("Scanners are read by scan_service.py.")
+    else:
+        # Start the scan writer, then the hub that reads every configured scanner (see SCANNERS in scanners.py)
+        # evdev is only needed here, so importing this module works on hosts without input devices
+        from scanners import ScannerHub
+        threading.Thread(target=scan_pipeline.run_writer, daemon=True).start()
+        threading.Thread(target=ScannerHub(scan_pipeline).run, daemon=True).start()
     
     # Start Flask app
-    print("Ready to scan items...")
-    socketio.run(app, host='0.0.0.0', port=5000)
+    logger.info("Ready to scan items (%s mode, %s bus, port %d)...", SOCKETIO_ASYNC_MODE, MESSAGE_BUS, PORT)
+    if SOCKETIO_ASYNC_MODE == 'gevent':
+        serve_gevent('0.0.0.0', PORT)
+    else:
+        # Werkzeug, which recent Flask-SocketIO versions refuse unless told; fine for a kiosk or two
+        socketio.run(app, host='0.0.0.0', port=PORT, allow_unsafe_werkzeug=True)
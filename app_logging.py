@@ -0,0 +1,125 @@
+import itertools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+# Minimum level written (DEBUG, INFO, WARNING, ERROR); debug output costs nothing unless enabled
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+# "text" for human-readable lines, "json" for one JSON object per line
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+
+# Per message template: at most LOG_RATE_LIMIT records every LOG_RATE_PERIOD seconds (below ERROR)
+LOG_RATE_LIMIT = int(os.getenv("LOG_RATE_LIMIT", "20"))
+LOG_RATE_PERIOD = float(os.getenv("LOG_RATE_PERIOD", "10"))
+
+# Periods a dropped-record count waits for its message to recur before it is forgotten
+LOG_RATE_KEEP_PERIODS = 6
+
+# Rows written by debug_rows() before it summarizes the rest
+DEBUG_ROW_SAMPLE = int(os.getenv("DEBUG_ROW_SAMPLE", "5"))
+
+# Attributes every LogRecord has; anything else came in through extra= and is a structured field
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+# Writes each record as a JSON object, including any fields passed with extra=
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in _RECORD_ATTRS})
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+# Writes each record as a text line, noting how many similar records RateLimitFilter dropped before it
+class TextFormatter(logging.Formatter):
+    def formatMessage(self, record):
+        text = super().formatMessage(record)
+        suppressed = getattr(record, 'suppressed', 0)
+        return f"{text} [{suppressed} similar messages suppressed]" if suppressed else text
+
+
+# Drops records once a message template has fired LOG_RATE_LIMIT times in the current period,
+# and sets `suppressed` (how many were dropped) on the first record let through afterwards.
+# Windows that have expired are swept once a period, so one-off messages don't pile up; a
+# suppressed count is kept for LOG_RATE_KEEP_PERIODS in case the message comes back to carry it.
+class RateLimitFilter(logging.Filter):
+    def __init__(self, limit=LOG_RATE_LIMIT, period=LOG_RATE_PERIOD):
+        super().__init__()
+        self.limit = limit
+        self.period = period
+        self.windows = {}  # (logger, template) -> [window start, count, suppressed]
+        self.next_sweep = time.monotonic() + period
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.ERROR or self.limit <= 0:
+            return True
+
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self.lock:
+            if now >= self.next_sweep:
+                self.sweep(now)
+
+            window = self.windows.get(key)
+            if window is None or now - window[0] >= self.period:
+                suppressed = window[2] if window else 0
+                self.windows[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                return True
+
+            window[1] += 1
+            if window[1] > self.limit:
+                window[2] += 1
+                return False
+            return True
+
+    # Function to drop expired windows; call with the lock held
+    def sweep(self, now):
+        self.next_sweep = now + self.period
+        for key, (start, count, suppressed) in list(self.windows.items()):
+            age = now - start
+            if age >= self.period and (not suppressed or age >= self.period * LOG_RATE_KEEP_PERIODS):
+                del self.windows[key]
+
+
+# Function to set up the root logger once per process (later calls are no-ops)
+def configure_logging(level=LOG_LEVEL, fmt=LOG_FORMAT):
+    root = logging.getLogger()
+    if any(getattr(handler, '_inventory_app', False) for handler in root.handlers):
+        return
+
+    handler = logging.StreamHandler(sys.stdout)
+    handler._inventory_app = True
+    if fmt == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(TextFormatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    handler.addFilter(RateLimitFilter())
+
+    root.addHandler(handler)
+    root.setLevel(level)
+
+
+# Function to log a sample of rows at DEBUG: the first `limit` rows, then a count of the rest
+# Does nothing (not even formatting) unless DEBUG is enabled for the logger
+def debug_rows(logger, label, rows, limit=DEBUG_ROW_SAMPLE):
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+
+    for row in itertools.islice(rows, limit):
+        logger.debug("%s: %s", label, dict(row))
+    if len(rows) > limit:
+        logger.debug("%s: %d more rows not shown", label, len(rows) - limit)
@@ -0,0 +1,45 @@
+#!/usr/bin/python3
+
+import argparse
+import sys
+import time
+
+from app_logging import configure_logging
+from db import connect
+from migrations import migrate
+from log_archive import ARCHIVE_DB_PATH, LOG_RETENTION_DAYS, archive_checkout_log, months_to_archive
+
+# Move checkout_log rows older than the retention horizon into the archive database.
+# Safe to run while the app is up (e.g. nightly from cron); --vacuum needs a quiet moment.
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive old checkout_log rows by month.")
+    parser.add_argument('--retention-days', type=int, default=LOG_RETENTION_DAYS,
+                        help=f"days of history kept in the hot database (default {LOG_RETENTION_DAYS})")
+    parser.add_argument('--archive', default=ARCHIVE_DB_PATH, help=f"archive database file (default {ARCHIVE_DB_PATH})")
+    parser.add_argument('--dry-run', action='store_true', help="list the months that would be archived")
+    parser.add_argument('--vacuum', action='store_true', help="compact the hot database afterwards")
+    args = parser.parse_args()
+
+    configure_logging()
+    conn = connect()
+    migrate(conn)
+    failed = {}
+
+    if args.dry_run:
+        print(f"Months due for archiving: {', '.join(months_to_archive(conn, args.retention_days)) or 'none'}")
+    else:
+        start = time.perf_counter()
+        results, failed = archive_checkout_log(conn, args.retention_days, args.archive)
+        print(f"Archived {sum(results.values())} rows from {len(results)} month(s) in {time.perf_counter() - start:.1f}s.")
+        for month, error in failed.items():
+            print(f"Failed to archive {month}: {error}")
+
+        if args.vacuum:
+            conn.execute('VACUUM main')
+            print("Compacted the hot database.")
+
+    conn.close()
+
+    # Nonzero for cron when a month failed; the next run retries it
+    if failed:
+        sys.exit(1)
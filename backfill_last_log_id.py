@@ -0,0 +1,18 @@
+#!/usr/bin/python3
+
+from app_logging import configure_logging
+from db import connect
+from migrations import migrate, backfill_last_log_id
+
+# Re-point every inventory row at its latest checkout_log entry.
+# Migration 2 does this once on upgrade; run this to repair rows written by hand.
+if __name__ == "__main__":
+    configure_logging()
+    conn = connect()
+    migrate(conn)
+
+    count = backfill_last_log_id(conn.cursor())
+    conn.commit()
+    print(f"Backfilled last_log_id for {count} items.")
+
+    conn.close()
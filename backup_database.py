@@ -0,0 +1,326 @@
+#!/usr/bin/python3
+
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import struct
+import sys
+import time
+import zlib
+from datetime import datetime
+
+import db
+from app_logging import configure_logging
+
+logger = logging.getLogger(__name__)
+
+# Online backups of the SQLite database through the backup API, so a backup is always a
+# consistent snapshot even while the app is writing.
+#
+#   python3 backup_database.py                      full backup into BACKUP_DIR
+#   python3 backup_database.py --compress           gzip it
+#   python3 backup_database.py --incremental        only the pages changed since the last full backup
+#   python3 backup_database.py --restore FILE --output restored.db
+#
+# Full backups are named <db>_backup_<timestamp>.db[.gz]; incrementals are
+# <db>_backup_<timestamp>.delta.gz and need the full backup named in their header to restore.
+
+BACKUP_DIR = os.getenv('BACKUP_DIR', '/mnt/external_drive/backups')
+
+# Full backups kept by rotation (incrementals go with their full backup)
+BACKUP_KEEP = int(os.getenv('BACKUP_KEEP', '14'))
+
+# Pages copied per backup step; each step is a short read transaction
+BACKUP_STEP_PAGES = int(os.getenv('BACKUP_STEP_PAGES', '1024'))
+
+# Seconds to wait between steps when the source is busy
+BACKUP_STEP_SLEEP = 0.05
+
+# A write from another connection restarts a stepped backup; after this many restarts the
+# copy is done in one step instead (under WAL a single read transaction never blocks writers)
+BACKUP_MAX_RESTARTS = 3
+
+# Pages read and compared at a time when building or applying an incremental
+DELTA_CHUNK_PAGES = 256
+
+DELTA_MAGIC = b'SQLDELTA1\n'
+
+# Temporary .snapshot and .partial files untouched for this long (seconds) belong to a backup
+# that died; rotation removes them (a running backup keeps writing to its own)
+BACKUP_STALE_SECONDS = 3600
+
+
+class BackupRestarted(Exception):
+    pass
+
+
+# Function to name a backup of db_path taken now
+# Microseconds keep two backups taken in the same second from overwriting each other
+def backup_name(db_path, suffix):
+    stem = os.path.splitext(os.path.basename(db_path))[0]
+    return f"{stem}_backup_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}{suffix}"
+
+
+# Function to list existing backups of db_path in backup_dir, oldest first: (full, incremental) name lists
+def list_backups(db_path, backup_dir):
+    prefix = os.path.splitext(os.path.basename(db_path))[0] + '_backup_'
+    names = sorted(name for name in os.listdir(backup_dir) if name.startswith(prefix))
+    full = [name for name in names if name.endswith(('.db', '.db.gz'))]
+    incremental = [name for name in names if name.endswith('.delta.gz')]
+    return full, incremental
+
+
+# Function to copy db_path into snapshot_path with the backup API, in steps of step_pages
+def snapshot(db_path, snapshot_path, step_pages=BACKUP_STEP_PAGES):
+    source = db.connect(db_path)
+    target = sqlite3.connect(snapshot_path)
+    restarts = 0
+    last_remaining = None
+
+    # Function to watch the step callback for restarts (remaining pages going back up)
+    def progress(status, remaining, total):
+        nonlocal restarts, last_remaining
+        if last_remaining is not None and remaining > last_remaining:
+            restarts += 1
+            if restarts > BACKUP_MAX_RESTARTS:
+                raise BackupRestarted()
+        last_remaining = remaining
+
+    try:
+        try:
+            source.backup(target, pages=step_pages, progress=progress, sleep=BACKUP_STEP_SLEEP)
+        except BackupRestarted:
+            logger.info("Backup restarted %d times under writes; copying in one step.", restarts)
+            source.backup(target, pages=-1)
+
+        # A backup is a standalone file: no -wal to carry around
+        target.execute('PRAGMA journal_mode=DELETE')
+        result = target.execute('PRAGMA integrity_check').fetchone()[0]
+        if result != 'ok':
+            raise RuntimeError(f"Integrity check failed on {snapshot_path}: {result}")
+    finally:
+        target.close()
+        source.close()
+
+
+# Function to open a backup file for reading, decompressing .gz transparently
+def open_backup(path):
+    return gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')
+
+
+# Function to write src (a file object) to path atomically, gzip-compressed if compress is set
+def write_file(src, path, compress):
+    partial = path + '.partial'
+    with (gzip.open(partial, 'wb', compresslevel=6) if compress else open(partial, 'wb')) as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+    os.replace(partial, path)
+
+
+# Function to read the page size from a database file's header
+def read_page_size(f):
+    header = f.read(100)
+    page_size = struct.unpack('>H', header[16:18])[0]
+    return 65536 if page_size == 1 else page_size
+
+
+# Function to write the pages of snapshot_path that differ from base_path into delta_path
+# Format: magic line, one JSON header line, then (page number, page bytes) records, all gzipped
+def write_delta(snapshot_path, base_path, delta_path):
+    with open(snapshot_path, 'rb') as f:
+        page_size = read_page_size(f)
+    page_count = os.path.getsize(snapshot_path) // page_size
+    chunk = page_size * DELTA_CHUNK_PAGES
+
+    digest = hashlib.sha256()
+    changed = 0
+    partial = delta_path + '.partial'
+    with open(snapshot_path, 'rb') as new, open_backup(base_path) as base, gzip.open(partial, 'wb') as out:
+        out.write(DELTA_MAGIC)
+        out.write(json.dumps({'base': os.path.basename(base_path), 'page_size': page_size,
+                              'page_count': page_count}).encode() + b'\n')
+
+        page_no = 0
+        while True:
+            new_chunk = new.read(chunk)
+            if not new_chunk:
+                break
+            digest.update(new_chunk)
+            base_chunk = base.read(len(new_chunk))
+            for offset in range(0, len(new_chunk), page_size):
+                page = new_chunk[offset:offset + page_size]
+                if page != base_chunk[offset:offset + page_size]:
+                    out.write(struct.pack('>I', page_no) + page)
+                    changed += 1
+                page_no += 1
+
+        # Trailer: page number 0xFFFFFFFF followed by the snapshot's SHA-256, checked on restore
+        out.write(struct.pack('>I', 0xFFFFFFFF) + digest.digest())
+    os.replace(partial, delta_path)
+    return changed, page_count
+
+
+# Function to read exactly size bytes from an incremental backup, raising ValueError if it ends first
+def read_delta(delta, size, backup_path):
+    data = delta.read(size)
+    if len(data) != size:
+        raise ValueError(f"{backup_path} is corrupt: it ends partway through a record")
+    return data
+
+
+# Function to rebuild a database file at output_path from a full or incremental backup
+# The file is built and checked at output_path + '.partial' and only then moved into place,
+# so a failed restore never leaves a half-written database where one was asked for
+def restore(backup_path, output_path):
+    partial = output_path + '.partial'
+    try:
+        if backup_path.endswith('.delta.gz'):
+            apply_delta(backup_path, partial)
+        else:
+            with open_backup(backup_path) as src, open(partial, 'wb') as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+
+        conn = sqlite3.connect(partial)
+        try:
+            result = conn.execute('PRAGMA integrity_check').fetchone()[0]
+        finally:
+            conn.close()
+        if result != 'ok':
+            raise RuntimeError(f"Integrity check failed on {output_path}: {result}")
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    os.replace(partial, output_path)
+
+
+# Function to write the snapshot an incremental backup was taken from to path: its full
+# backup patched with the changed pages, checked against the snapshot's SHA-256
+def apply_delta(backup_path, path):
+    try:
+        with gzip.open(backup_path, 'rb') as delta:
+            if delta.readline() != DELTA_MAGIC:
+                raise ValueError(f"{backup_path} is not an incremental backup")
+            try:
+                header = json.loads(delta.readline())
+                page_size, page_count, base = header['page_size'], header['page_count'], header['base']
+            except (ValueError, KeyError, TypeError):
+                raise ValueError(f"{backup_path} is corrupt: unreadable header") from None
+
+            base_path = os.path.join(os.path.dirname(backup_path), base)
+            with open_backup(base_path) as src, open(path, 'wb') as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+
+            with open(path, 'r+b') as out:
+                while True:
+                    page_no = struct.unpack('>I', read_delta(delta, 4, backup_path))[0]
+                    if page_no == 0xFFFFFFFF:
+                        expected = read_delta(delta, 32, backup_path)
+                        break
+                    out.seek(page_no * page_size)
+                    out.write(read_delta(delta, page_size, backup_path))
+                out.truncate(page_count * page_size)
+    except (EOFError, gzip.BadGzipFile, zlib.error):
+        raise ValueError(f"{backup_path} is corrupt: the compressed stream is damaged") from None
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    if digest.digest() != expected:
+        raise RuntimeError(f"Restoring {backup_path} does not reproduce the snapshot it was taken from")
+
+
+# Function to delete full backups beyond the newest `keep`, and incrementals whose full backup is gone
+def rotate(db_path, backup_dir, keep=BACKUP_KEEP):
+    full, incremental = list_backups(db_path, backup_dir)
+    removed = full[:-keep] if keep > 0 else []
+    kept = set(full) - set(removed)
+
+    for name in incremental:
+        try:
+            with gzip.open(os.path.join(backup_dir, name), 'rb') as delta:
+                delta.readline()
+                base = json.loads(delta.readline())['base']
+        except (OSError, ValueError, EOFError):
+            continue  # Leave anything unreadable for a person to look at
+        if base not in kept:
+            removed.append(name)
+
+    for name in removed:
+        os.remove(os.path.join(backup_dir, name))
+        logger.info("Removed old backup %s", name)
+
+    # Snapshots and partial files left by a backup that was killed partway
+    prefix = os.path.splitext(os.path.basename(db_path))[0] + '_backup_'
+    for name in os.listdir(backup_dir):
+        path = os.path.join(backup_dir, name)
+        if (name.startswith(prefix) and name.endswith(('.snapshot', '.partial'))
+                and time.time() - os.path.getmtime(path) > BACKUP_STALE_SECONDS):
+            os.remove(path)
+            logger.info("Removed stale backup file %s", name)
+    return removed
+
+
+# Function to take one backup of db_path; returns the backup's path
+# Incremental mode falls back to a full backup when there is no full backup to diff against
+def backup(db_path=None, backup_dir=BACKUP_DIR, compress=False, incremental=False, keep=BACKUP_KEEP,
+           step_pages=BACKUP_STEP_PAGES):
+    db_path = db_path or db.DATABASE_PATH
+    # Opening a mistyped path would create, and back up, an empty database
+    if not os.path.isfile(db_path):
+        raise FileNotFoundError(f"No database at {db_path}")
+    os.makedirs(backup_dir, exist_ok=True)
+
+    snapshot_path = os.path.join(backup_dir, backup_name(db_path, '.snapshot'))
+    snapshot(db_path, snapshot_path, step_pages)
+    try:
+        full, _ = list_backups(db_path, backup_dir)
+        if incremental and full:
+            path = os.path.join(backup_dir, backup_name(db_path, '.delta.gz'))
+            changed, page_count = write_delta(snapshot_path, os.path.join(backup_dir, full[-1]), path)
+            logger.info("Incremental backup against %s: %d of %d pages changed.", full[-1], changed, page_count)
+        else:
+            path = os.path.join(backup_dir, backup_name(db_path, '.db.gz' if compress else '.db'))
+            with open(snapshot_path, 'rb') as src:
+                write_file(src, path, compress)
+    finally:
+        os.remove(snapshot_path)
+
+    rotate(db_path, backup_dir, keep)
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Back up the inventory database online, or restore a backup.")
+    parser.add_argument('--db', default=db.DATABASE_PATH, help=f"database to back up (default {db.DATABASE_PATH})")
+    parser.add_argument('--dir', default=BACKUP_DIR, help=f"backup directory (default {BACKUP_DIR})")
+    parser.add_argument('--compress', action='store_true', help="gzip full backups")
+    parser.add_argument('--incremental', action='store_true',
+                        help="store only the pages changed since the newest full backup")
+    parser.add_argument('--keep', type=int, default=BACKUP_KEEP,
+                        help=f"full backups to keep, 0 for all (default {BACKUP_KEEP})")
+    parser.add_argument('--step-pages', type=int, default=BACKUP_STEP_PAGES,
+                        help=f"pages copied per step (default {BACKUP_STEP_PAGES})")
+    parser.add_argument('--restore', metavar='BACKUP', help="restore this backup instead of taking one")
+    parser.add_argument('--output', help="with --restore, the database file to write")
+    args = parser.parse_args()
+
+    configure_logging()
+    start = time.perf_counter()
+    try:
+        if args.restore:
+            if not args.output:
+                parser.error("--restore needs --output")
+            restore(args.restore, args.output)
+            print(f"Restored {args.restore} to {args.output} in {time.perf_counter() - start:.1f}s (integrity ok)")
+        else:
+            path = backup(args.db, args.dir, args.compress, args.incremental, args.keep, args.step_pages)
+            print(f"Backup created at {path} in {time.perf_counter() - start:.1f}s (integrity ok)")
+    except (OSError, sqlite3.Error, RuntimeError, ValueError) as e:
+        print(f"Backup failed: {e}")
+        sys.exit(1)
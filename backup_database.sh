@@ -1,16 +1,9 @@
 #!/bin/bash
 
-DB_PATH="${DB_PATH:-./inventory.db}"  # Path to the database file; defaults to 'inventory.db' in current directory
-BACKUP_DIR="${BACKUP_DIR:-/mnt/external_drive/backups}"  # Path to backup directory; defaults to an external drive path
+# Thin wrapper kept for existing cron entries; see backup_database.py for the options
+# (e.g. ./backup_database.sh --compress, ./backup_database.sh --incremental)
 
-# Create the backup directory if it doesn't exist
-mkdir -p "$BACKUP_DIR"
+export DB_PATH="${DB_PATH:-./inventory.db}"  # Path to the database file; defaults to 'inventory.db' in current directory
+export BACKUP_DIR="${BACKUP_DIR:-/mnt/external_drive/backups}"  # Path to backup directory; defaults to an external drive path
 
-# Define the backup file name with timestamp
-BACKUP_FILE="$BACKUP_DIR/inventory_backup_$(date +'%Y%m%d_%H%M%S').db"
-
-# Perform the backup
-cp "$DB_PATH" "$BACKUP_FILE"
-
-# Print a confirmation message
-echo "Backup created at $BACKUP_FILE"
+exec python3 "$(dirname "$0")/backup_database.py" "$@"
@@ -0,0 +1,6 @@
+# Benchmarks for the inventory app against a synthetic database
+#
+#   python3 -m benchmarks.generate bench.db --items 50000 --log-rows 5000000
+#   python3 -m benchmarks.run bench.db --output report.json
+#   python3 -m benchmarks.run bench.db --baseline report.json
+#   python3 -m benchmarks.run bench.db --app        # also time the web routes and socket handlers
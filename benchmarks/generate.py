@@ -0,0 +1,147 @@
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from db import connect
+from migrations import backfill_item_rollup, migrate
+
+# Synthetic inventory.db generator. The same arguments and seed give the same rows
+# (dates are relative to the day it runs, so overdue counts are comparable day to day).
+
+FIRST_NAMES = ['Alex', 'Blair', 'Casey', 'Dana', 'Eli', 'Frankie', 'Gray', 'Harper', 'Indy', 'Jordan',
+               'Kai', 'Logan', 'Morgan', 'Noel', 'Oakley', 'Parker', 'Quinn', 'Riley', 'Sage', 'Taylor']
+LAST_NAMES = ['Adams', 'Brooks', 'Chen', 'Diaz', 'Evans', 'Fischer', 'Garcia', 'Hughes', 'Ito', 'Jensen',
+              'Khan', 'Lopez', 'Meyer', 'Novak', 'Okafor', 'Patel', 'Reyes', 'Silva', 'Tanaka', 'Varner']
+ITEM_KINDS = ['Projector', 'Laptop', 'Wireless Mic', 'Camera', 'Tripod', 'Speaker', 'Mixer', 'Tablet',
+              'HDMI Switcher', 'Document Camera', 'Extension Cord', 'Clicker']
+ITEM_BRANDS = ['Epson', 'Dell', 'Shure', 'Canon', 'Manfrotto', 'JBL', 'Yamaha', 'Apple', 'Extron', 'Elmo']
+
+# Share of employees left active; the rest are former staff still referenced by old log rows
+ACTIVE_SHARE = 0.95
+
+# Longest loan, in days
+MAX_LOAN_DAYS = 14
+
+
+# Function to generate the checkout_log rows in time order, tracking each item's final state
+# Every item gets a 'create' row first; after that a random item is checked out or in each step
+def generate_log_rows(rng, items, employees, log_rows, start, end, state):
+    step = (end - start).total_seconds() / log_rows
+    for n in range(log_rows):
+        timestamp = (start + timedelta(seconds=n * step)).strftime('%Y-%m-%d %H:%M:%S')
+        log_id = n + 1
+
+        if n < items:
+            index, action, who, due = n, 'create', 'system', None
+            state[index] = ('in', 'system', None, timestamp, log_id)
+        else:
+            index = rng.randrange(items)
+            if state[index][0] == 'in':
+                action, who = 'checkout', str(rng.randint(1, employees))
+                due = (start + timedelta(seconds=n * step, days=rng.randint(1, MAX_LOAN_DAYS))).strftime('%Y-%m-%d')
+                state[index] = ('out', who, due, timestamp, log_id)
+            else:
+                action, who, due = 'checkin', state[index][1], None
+                state[index] = ('in', who, None, timestamp, log_id)
+        yield log_id, barcode_for(index), who, timestamp, action, due
+
+
+# Function to give item number `index` its barcode
+def barcode_for(index):
+    return f'AV{index:07d}'
+
+
+# Function to create a synthetic database at path; returns a summary of what was generated
+def generate_database(path, items=50000, employees=500, log_rows=5000000, days=365, seed=0):
+    if log_rows < items:
+        raise ValueError("log_rows must be at least items (every item has a 'create' row)")
+
+    rng = random.Random(seed)
+    end = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    start = end - timedelta(days=days)
+
+    conn = connect(path)
+    migrate(conn)
+    conn.execute('PRAGMA synchronous=OFF')  # A half-written benchmark database is simply regenerated
+
+    cursor = conn.cursor()
+    cursor.execute('BEGIN')
+
+    employee_rows = []
+    for employee_id in range(1, employees + 1):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        employee_rows.append((employee_id, f'{first} {last}', f'{first}.{last}.{employee_id}@example.org'.lower(),
+                              1 if rng.random() < ACTIVE_SHARE else 0))
+    cursor.executemany('INSERT INTO employees (id, name, email, active) VALUES (?, ?, ?, ?)', employee_rows)
+
+    cursor.executemany(
+        'INSERT INTO inventory (id, barcode, status, checked_out_by, expected_return_date, description) VALUES (?, ?, ?, ?, ?, ?)',
+        ((index + 1, barcode_for(index), 'in', 'system', None,
+          f'{rng.choice(ITEM_KINDS)} ({rng.choice(ITEM_BRANDS)}) #{index}') for index in range(items)))
+
+    # Building the log indexes after the load is much faster than updating them row by row;
+    # they are recreated from the definitions the migrations stored
+    log_indexes = cursor.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'checkout_log' AND sql IS NOT NULL").fetchall()
+    for index in log_indexes:
+        cursor.execute(f"DROP INDEX {index['name']}")
+
+    # (status, checked_out_by, expected_return_date, checkout_timestamp, last_log_id) per item
+    state = [None] * items
+    cursor.executemany('INSERT INTO checkout_log (id, barcode, checked_out_by, timestamp, action, expected_return_date) VALUES (?, ?, ?, ?, ?, ?)',
+                       generate_log_rows(rng, items, employees, log_rows, start, end, state))
+
+    for index in log_indexes:
+        cursor.execute(index['sql'])
+
+    cursor.executemany('''
+        UPDATE inventory
+        SET status = ?, checked_out_by = ?, expected_return_date = ?, checkout_timestamp = ?, last_log_id = ?
+        WHERE id = ?
+    ''', (item_state + (index + 1,) for index, item_state in enumerate(state)))
+    backfill_item_rollup(cursor)
+
+    conn.commit()
+    conn.execute('PRAGMA optimize')
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')  # Leave a single self-contained file to copy
+    conn.close()
+
+    return {
+        'items': items,
+        'employees': employees,
+        'log_rows': log_rows,
+        'days': days,
+        'seed': seed,
+        'checked_out': sum(1 for item_state in state if item_state[0] == 'out'),
+    }
+
+
+# Function to add the dataset arguments shared with benchmarks.run
+def add_dataset_arguments(parser):
+    parser.add_argument('--items', type=int, default=50000, help="inventory rows (default 50000)")
+    parser.add_argument('--employees', type=int, default=500, help="employee rows (default 500)")
+    parser.add_argument('--log-rows', type=int, default=5000000, help="checkout_log rows (default 5000000)")
+    parser.add_argument('--days', type=int, default=365, help="days of history the log covers (default 365)")
+    parser.add_argument('--seed', type=int, default=0, help="random seed (default 0)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic inventory database for benchmarking.")
+    parser.add_argument('path', nargs='?', default='bench.db', help="database file to create (default bench.db)")
+    parser.add_argument('--force', action='store_true', help="replace the file if it exists")
+    add_dataset_arguments(parser)
+    args = parser.parse_args()
+
+    if os.path.exists(args.path):
+        if not args.force:
+            sys.exit(f"{args.path} already exists; pass --force to replace it.")
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(args.path + suffix):
+                os.remove(args.path + suffix)
+
+    started = time.perf_counter()
+    summary = generate_database(args.path, args.items, args.employees, args.log_rows, args.days, args.seed)
+    print(f"Generated {args.path} in {time.perf_counter() - started:.1f}s: {summary}")
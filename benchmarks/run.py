@@ -0,0 +1,244 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import ThreadingHTTPServer
+
+import db
+import inventory_core
+import log_archive
+from app_logging import configure_logging
+from benchmarks.generate import add_dataset_arguments, generate_database
+from fake_mailgun import FakeMailgunHandler
+from item_cache import ItemStateCache
+
+# Times the hot paths against a synthetic database and writes a JSON report.
+# Runs on a copy of the database, so every run starts from the same rows. By default only the
+# data layer (inventory_core, the item cache) is timed; --app also imports the web app (Flask,
+# SocketIO) after DATABASE_PATH and MAILGUN_API_BASE point at the copy and a local fake Mailgun,
+# and times its routes and socket handlers.
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class QuietMailgunHandler(FakeMailgunHandler):
+    announce = False
+
+
+# Function to summarize a list of durations (seconds) in milliseconds
+def summarize(durations):
+    ordered = sorted(durations)
+    total = sum(ordered)
+    return {
+        'runs': len(ordered),
+        'mean_ms': round(total / len(ordered) * 1000, 3),
+        'median_ms': round(statistics.median(ordered) * 1000, 3),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+        'min_ms': round(ordered[0] * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3),
+        'ops_per_sec': round(len(ordered) / total, 3) if total else None,
+    }
+
+
+# Function to time fn once per argument tuple, returning the durations in seconds
+def time_calls(fn, calls):
+    durations = []
+    for args in calls:
+        start = time.perf_counter()
+        fn(*args)
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+# Function to start a fake Mailgun on a free local port; returns its API base URL
+def start_fake_mailgun():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), QuietMailgunHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_address[1]}/v3'
+
+
+# Function to describe the code and machine a report came from
+def get_environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPO_DIR,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        commit, dirty = None, None
+
+    return {
+        'commit': commit,
+        'dirty': dirty,
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+# Function to run every benchmark against the database at path (which it modifies)
+# The app-level benchmarks run only when include_app is set
+def run_benchmarks(path, repeat=5, lookups=2000, submissions=500, seed=0, include_app=False):
+    db.DATABASE_PATH = path
+    # The archive is attached by path too; keep it next to the copy rather than in the working directory
+    log_archive.ARCHIVE_DB_PATH = os.path.join(os.path.dirname(path), 'inventory_archive.db')
+    os.environ['MAILGUN_API_BASE'] = start_fake_mailgun()
+    for name, value in (('MAILGUN_API_KEY', 'benchmark'), ('MAILGUN_DOMAIN', 'example.org'),
+                        ('MAILGUN_FROM_EMAIL', 'inventory@example.org'), ('LOG_LEVEL', 'WARNING')):
+        os.environ.setdefault(name, value)
+    # Before anything else configures logging (app_logging read LOG_LEVEL when this module imported it)
+    configure_logging(os.environ['LOG_LEVEL'])
+    inventory_core.initialize_database()
+
+    rng = random.Random(seed)
+    conn = db.get_db_connection()
+    dataset = {
+        'items': conn.execute('SELECT COUNT(*) FROM inventory').fetchone()[0],
+        'employees': conn.execute('SELECT COUNT(*) FROM employees').fetchone()[0],
+        'log_rows': conn.execute('SELECT COUNT(*) FROM checkout_log').fetchone()[0],
+        'checked_out': conn.execute("SELECT COUNT(*) FROM inventory WHERE status = 'out'").fetchone()[0],
+        'file_bytes': os.path.getsize(path),
+    }
+    barcodes = [row[0] for row in conn.execute('SELECT barcode FROM inventory')]
+    employee_ids = [row[0] for row in conn.execute('SELECT id FROM employees WHERE active = 1')]
+    db.release_db_connection()
+
+    results = {}
+
+    # Full inventory listing (the pre-pagination dashboard query)
+    inventory_core.get_inventory_data()  # Warm the page cache
+    results['get_inventory_data'] = summarize(time_calls(inventory_core.get_inventory_data, [()] * repeat))
+    db.release_db_connection()
+
+    # First dashboard page (the query behind / and /get_inventory)
+    results['get_inventory_page'] = summarize(time_calls(inventory_core.get_inventory_page, [()] * (repeat * 4)))
+    db.release_db_connection()
+
+    # Item state lookups: random barcodes (about 5% unknown), first with an empty item cache, then warm
+    lookup_barcodes = [(rng.choice(barcodes) if rng.random() < 0.95 else f'UNKNOWN{n}',) for n in range(lookups)]
+    item_cache = ItemStateCache()
+    conn = db.get_db_connection()
+    results['item_cache_get_cold'] = summarize(time_calls(lambda barcode: item_cache.get(conn, barcode), lookup_barcodes))
+    results['item_cache_get_warm'] = summarize(time_calls(lambda barcode: item_cache.get(conn, barcode), lookup_barcodes))
+    db.release_db_connection()
+
+    if include_app:
+        results.update(run_app_benchmarks(rng, barcodes, employee_ids, repeat, lookup_barcodes, submissions))
+
+    # Overdue notification run against the fake Mailgun (once: the ledger makes reruns no-ops)
+    results['check_overdue_items'] = summarize(time_calls(inventory_core.check_overdue_items, [()]))
+    conn = db.get_db_connection()
+    dataset['notifications_sent'] = conn.execute('SELECT COUNT(*) FROM notification_log').fetchone()[0]
+    db.release_db_connection()
+
+    return dataset, results
+
+
+# Function to time the web app's routes and socket handlers (--app)
+def run_app_benchmarks(rng, barcodes, employee_ids, repeat, lookup_barcodes, submissions):
+    import app as inventory_app
+
+    client = inventory_app.app.test_client()
+    results = {}
+
+    # Dashboard first render
+    def get_index():
+        response = client.get('/')
+        assert response.status_code == 200, response.status_code
+
+    get_index()  # Compile the template
+    results['index_render'] = summarize(time_calls(get_index, [()] * (repeat * 4)))
+
+    # Item status lookups over HTTP, first with an empty item cache, then warm
+    def get_item_status(barcode):
+        response = client.get('/get_item_status', query_string={'barcode': barcode})
+        assert response.status_code == 200, response.status_code
+
+    inventory_app.item_cache.invalidate()
+    results['get_item_status_cold'] = summarize(time_calls(get_item_status, lookup_barcodes))
+    results['get_item_status_warm'] = summarize(time_calls(get_item_status, lookup_barcodes))
+
+    # Checkout/check-in submissions, one transaction and broadcast each
+    due_date = (datetime.now() + timedelta(days=7)).strftime('%Y-%m-%d')
+    submissions_data = [({'barcode': rng.choice(barcodes), 'employee_id': rng.choice(employee_ids),
+                          'expected_return_date': due_date},) for _ in range(submissions)]
+    results['handle_name_submission'] = summarize(time_calls(inventory_app.handle_name_submission, submissions_data))
+    db.release_db_connection()
+    return results
+
+
+# Function to print each result's median next to a baseline report's
+def print_comparison(report, baseline, out=sys.stderr):
+    print(f"{'benchmark':<26} {'baseline ms':>12} {'current ms':>12} {'change':>8}", file=out)
+    for name, result in report['results'].items():
+        before = baseline.get('results', {}).get(name)
+        if before is None:
+            print(f"{name:<26} {'-':>12} {result['median_ms']:>12.3f} {'new':>8}", file=out)
+            continue
+        change = (result['median_ms'] - before['median_ms']) / before['median_ms'] * 100 if before['median_ms'] else 0.0
+        print(f"{name:<26} {before['median_ms']:>12.3f} {result['median_ms']:>12.3f} {change:>+7.1f}%", file=out)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the inventory app against a synthetic database.")
+    parser.add_argument('path', nargs='?', default='bench.db',
+                        help="synthetic database; generated with the dataset options if missing (default bench.db)")
+    parser.add_argument('--output', default='-', help="where to write the JSON report (default stdout)")
+    parser.add_argument('--baseline', help="earlier JSON report to compare medians against")
+    parser.add_argument('--repeat', type=int, default=5, help="runs of the full-table benchmarks (default 5)")
+    parser.add_argument('--lookups', type=int, default=2000, help="/get_item_status requests per pass (default 2000)")
+    parser.add_argument('--submissions', type=int, default=500, help="handle_name_submission calls, with --app (default 500)")
+    parser.add_argument('--app', action='store_true',
+                        help="also benchmark the web app's routes and socket handlers (imports Flask and SocketIO)")
+    parser.add_argument('--in-place', action='store_true', help="run on the database itself instead of a copy")
+    add_dataset_arguments(parser)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.path):
+        print(f"Generating {args.path}...", file=sys.stderr)
+        generate_database(args.path, args.items, args.employees, args.log_rows, args.days, args.seed)
+
+    work_dir = None
+    path = os.path.abspath(args.path)
+    if not args.in_place:
+        work_dir = tempfile.mkdtemp(prefix='inventory-bench-')
+        path = os.path.join(work_dir, 'inventory.db')
+        shutil.copyfile(args.path, path)
+
+    try:
+        dataset, results = run_benchmarks(path, args.repeat, args.lookups, args.submissions, args.seed, args.app)
+    finally:
+        if work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        'created_at': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'environment': get_environment(),
+        'dataset': dataset,
+        'settings': {'repeat': args.repeat, 'lookups': args.lookups, 'submissions': args.submissions, 'seed': args.seed,
+                     'app': args.app},
+        'results': results,
+    }
+
+    if args.output == '-':
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            print_comparison(report, json.load(f))
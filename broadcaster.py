@@ -0,0 +1,59 @@
+import logging
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Events waiting to be emitted; when full, publishers wait for the sender to catch up
+BROADCAST_QUEUE_SIZE = 1024
+
+
+# Ordered, non-blocking fan-out: request handlers and the scan writer publish() events and
+# return at once; one sender task emits them to every client in the order published.
+# A slow client or a large room then delays only the sender, never a database write.
+class Broadcaster:
+    def __init__(self, emit, start_task, maxsize=BROADCAST_QUEUE_SIZE):
+        self.emit = emit  # emit(event, payload), e.g. socketio.emit
+        self.start_task = start_task  # e.g. socketio.start_background_task, so the sender fits the async mode
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.started = False
+
+        # Metrics, guarded by the lock
+        self.lock = threading.Lock()
+        self.published = 0
+        self.emitted = 0
+        self.errors = 0
+
+    # Function to queue an event for every client, starting the sender on first use
+    def publish(self, event, payload):
+        with self.lock:
+            self.published += 1
+            if not self.started:
+                self.started = True
+                self.start_task(self.run_sender)
+        self.queue.put((event, payload))
+
+    # Sender loop; started by the first publish()
+    def run_sender(self):
+        while True:
+            event, payload = self.queue.get()
+            try:
+                self.emit(event, payload)
+            except Exception:
+                logger.exception("Failed to emit %s.", event)
+                with self.lock:
+                    self.errors += 1
+            else:
+                with self.lock:
+                    self.emitted += 1
+
+    # Function to snapshot the counters for /metrics
+    def get_metrics(self):
+        with self.lock:
+            return {
+                'queue_depth': self.queue.qsize(),
+                'queue_capacity': self.queue.maxsize,
+                'published': self.published,
+                'emitted': self.emitted,
+                'errors': self.errors,
+            }
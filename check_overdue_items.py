@@ -1,4 +1,16 @@
-from app import check_overdue_items  # Adjust the import according to your project structure
+import argparse
+
+from app_logging import configure_logging
+from inventory_core import check_overdue_items, initialize_database
 
 if __name__ == "__main__":
-    check_overdue_items()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Email employees about overdue items.")
+    parser.add_argument('--digest', action='store_true',
+                        help="send each employee one email listing all of their overdue items")
+    parser.add_argument('--admin-summary', action='store_true',
+                        help="with --digest, also email a summary of the run to MAILGUN_TO_EMAIL")
+    args = parser.parse_args()
+
+    configure_logging()
+    initialize_database()
+    check_overdue_items(digest=args.digest, admin_summary=args.admin_summary)
@@ -0,0 +1,195 @@
+import functools
+import logging
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+# Path to the SQLite database shared by the web app, the scanner thread and the cron jobs
+# (DB_PATH is also what backup_database.sh reads)
+DATABASE_PATH = os.getenv('DB_PATH', 'inventory.db')
+
+# How long a writer waits on a locked database before giving up (milliseconds)
+BUSY_TIMEOUT_MS = 5000
+
+# Compiled statements kept per connection; the app only runs a few dozen distinct queries
+CACHED_STATEMENTS = 256
+
+# Idle connections kept for reuse; extra connections are closed when released
+POOL_SIZE = 8
+
+# Worker threads that run the web app's database work (see run_db); also caps concurrent queries
+DB_EXECUTOR_WORKERS = int(os.getenv('DB_EXECUTOR_WORKERS', str(POOL_SIZE)))
+
+# Statements slower than this (milliseconds, execute or fetch) are logged at WARNING; 0 disables the slow-query log
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '0'))
+
+SQL_QUERY_SECONDS = Histogram('inventory_sql_query_duration_seconds',
+                              'Time spent in SQLite per statement, split into execute and fetch',
+                              ['statement', 'phase'])
+
+_pool = queue.LifoQueue(maxsize=POOL_SIZE)
+_local = threading.local()
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+# Function to turn SQL text into a metric label: whitespace collapsed, length capped
+# Parameters are always bound, so the app produces a small fixed set of labels
+@functools.lru_cache(maxsize=512)
+def statement_label(sql):
+    return ' '.join(sql.split())[:120]
+
+
+# Function to record how long one phase of a statement took
+def record_query_time(sql, phase, elapsed):
+    SQL_QUERY_SECONDS.observe(elapsed, statement=statement_label(sql), phase=phase)
+    if SLOW_QUERY_MS and elapsed * 1000 >= SLOW_QUERY_MS:
+        logger.warning("Slow query (%s %.1f ms): %s", phase, elapsed * 1000, statement_label(sql))
+
+
+# Cursor that times every execute and fetch call
+# Rows read by iterating the cursor are not timed; use fetchall() on hot paths
+class InstrumentedCursor(sqlite3.Cursor):
+    statement = ''
+
+    def _timed(self, phase, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            record_query_time(self.statement, phase, time.perf_counter() - start)
+
+    def execute(self, sql, parameters=()):
+        self.statement = sql
+        return self._timed('execute', super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        self.statement = sql
+        return self._timed('execute', super().executemany, sql, seq_of_parameters)
+
+    def executescript(self, script):
+        self.statement = script
+        return self._timed('execute', super().executescript, script)
+
+    def fetchone(self):
+        return self._timed('fetch', super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._timed('fetch', super().fetchmany, self.arraysize if size is None else size)
+
+    def fetchall(self):
+        return self._timed('fetch', super().fetchall)
+
+
+# Connection whose shortcut execute methods go through InstrumentedCursor as well
+class InstrumentedConnection(sqlite3.Connection):
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, script):
+        return self.cursor().executescript(script)
+
+
+# Function to open a new tuned connection
+def connect(path=None):
+    # Pooled connections move between worker threads, one thread at a time
+    conn = sqlite3.connect(path or DATABASE_PATH, timeout=BUSY_TIMEOUT_MS / 1000, factory=InstrumentedConnection,
+                           cached_statements=CACHED_STATEMENTS, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+
+    # WAL lets the scanner thread write while web workers read, and NORMAL sync is safe under WAL
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+    return conn
+
+
+# Function to get the connection bound to the current thread, taking one from the pool if needed
+def get_db_connection():
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        try:
+            conn = _pool.get_nowait()
+        except queue.Empty:
+            conn = connect()
+        _local.conn = conn
+    return conn
+
+
+# Function to hand the current thread's connection back to the pool
+def release_db_connection(exception=None):
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        return
+    _local.conn = None
+
+    # Never pool a connection with a half-finished transaction
+    if conn.in_transaction:
+        conn.rollback()
+
+    try:
+        _pool.put_nowait(conn)
+    except queue.Full:
+        conn.close()
+
+
+# Function to close every pooled connection, e.g. before replacing the database file
+def close_all_connections():
+    release_db_connection()
+    while True:
+        try:
+            _pool.get_nowait().close()
+        except queue.Empty:
+            break
+
+
+# Function to get the executor for database work, creating it on first use
+# Under gevent the workers are native threads whose results are awaited cooperatively, so a
+# slow query only parks the greenlet that asked for it, never the event loop
+def get_db_executor():
+    global _executor
+    if _executor is not None:
+        return _executor
+
+    with _executor_lock:
+        if _executor is None:
+            monkey = sys.modules.get('gevent.monkey')
+            if monkey is not None and monkey.is_module_patched('threading'):
+                from gevent.threadpool import ThreadPoolExecutor
+            else:
+                from concurrent.futures import ThreadPoolExecutor
+            _executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS)
+        return _executor
+
+
+# Function to run fn on an executor worker, rolling back whatever it left open on the worker's connection
+# Teardown (release_db_connection) runs on the caller's thread, which never sees this connection,
+# so without this a handler that raised mid-write would hold the write lock for good
+def run_on_worker(fn, *args, **kwargs):
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        conn = getattr(_local, 'conn', None)
+        if conn is not None and conn.in_transaction:
+            conn.rollback()
+
+
+# Function to run fn(*args, **kwargs) on the database executor and return its result
+# Each worker keeps its own pooled connection (get_db_connection), so fn uses it as usual.
+# Don't call this from inside fn: a worker waiting on another worker can exhaust the pool.
+def run_db(fn, *args, **kwargs):
+    return get_db_executor().submit(run_on_worker, fn, *args, **kwargs).result()
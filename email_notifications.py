@@ -1,6 +1,13 @@
+import logging
 import requests
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
@@ -10,23 +17,157 @@ MAILGUN_DOMAIN = os.getenv("MAILGUN_DOMAIN")
 MAILGUN_FROM_EMAIL = os.getenv("MAILGUN_FROM_EMAIL")
 MAILGUN_TO_EMAIL = os.getenv("MAILGUN_TO_EMAIL")
 
-# Function to send email
-def send_notification(barcode, expected_return_date, to_email):
-    response = requests.post(
-        f"https://api.mailgun.net/v3/{MAILGUN_DOMAIN}/messages",
-        auth=("api", MAILGUN_API_KEY),
+# Override to point at a local fake Mailgun (see fake_mailgun.py) when testing
+MAILGUN_API_BASE = os.getenv("MAILGUN_API_BASE", "https://api.mailgun.net/v3")
+
+# Number of emails sent in parallel; also the size of the keep-alive connection pool
+NOTIFY_MAX_WORKERS = int(os.getenv("NOTIFY_MAX_WORKERS", "8"))
+
+# (connect, read) timeout in seconds for each API call
+REQUEST_TIMEOUT = (5, 30)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+# Function to create an HTTP session with a connection pool and retry/backoff on 429 and 5xx
+def create_session(pool_size=NOTIFY_MAX_WORKERS):
+    retry = Retry(
+        total=5,
+        backoff_factor=0.5,  # 0.5s, 1s, 2s, ... between attempts
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(['POST']),
+        respect_retry_after_header=True,
+        raise_on_status=False  # Hand back the last response instead of raising
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.auth = ("api", MAILGUN_API_KEY)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# Function to get the shared session, created on first use
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = create_session()
+    return _session
+
+
+# Function to post one message through the Mailgun API
+def post_message(to_email, subject, text, session=None):
+    session = session or get_session()
+    return session.post(
+        f"{MAILGUN_API_BASE}/{MAILGUN_DOMAIN}/messages",
         data={
             "from": MAILGUN_FROM_EMAIL,
             "to": to_email,
-            "subject": f"Item {barcode} is still checked out!",
-            "text": f"Item with barcode {barcode} was expected to be returned on {expected_return_date}, but is still checked out."
-        }
+            "subject": subject,
+            "text": text
+        },
+        timeout=REQUEST_TIMEOUT
+    )
+
+
+# Function to send email
+def send_notification(barcode, expected_return_date, to_email, session=None):
+    response = post_message(
+        to_email,
+        f"Item {barcode} is still checked out!",
+        f"Item with barcode {barcode} was expected to be returned on {expected_return_date}, but is still checked out.",
+        session
     )
 
     # Debugging output
     if response.status_code == 200:
-        print(f"Email sent successfully for item {barcode} to {to_email}!")
+        logger.info("Email sent successfully for item %s to %s!", barcode, to_email)
+    else:
+        logger.warning("Failed to send email for item %s to %s. Status code: %s, Response: %s",
+                       barcode, to_email, response.status_code, response.text)
+
+    return response
+
+
+# Function to send one email listing every overdue item an employee holds
+# items is a list of (barcode, description, expected_return_date) tuples
+def send_digest(to_email, items, session=None):
+    lines = [f"- {description or 'Item'} (barcode {barcode}), due {expected_return_date}"
+             for barcode, description, expected_return_date in items]
+    response = post_message(
+        to_email,
+        f"{len(items)} item(s) still checked out past their return date",
+        "The following items were expected back but are still checked out:\n\n" + "\n".join(lines),
+        session
+    )
+
+    if response.status_code == 200:
+        logger.info("Digest of %d item(s) sent successfully to %s!", len(items), to_email)
     else:
-        print(f"Failed to send email for item {barcode} to {to_email}. Status code: {response.status_code}, Response: {response.text}")
+        logger.warning("Failed to send digest to %s. Status code: %s, Response: %s", to_email, response.status_code, response.text)
+
+    return response
+
+
+# Function to send the admin (MAILGUN_TO_EMAIL) a summary of a digest run
+# digests is a list of ((to_email, items), sent) pairs
+def send_admin_summary(digests, session=None):
+    if not MAILGUN_TO_EMAIL:
+        logger.warning("MAILGUN_TO_EMAIL is not set; skipping the admin summary.")
+        return None
+
+    lines = []
+    for (to_email, items), sent in digests:
+        lines.append(f"{to_email}: {len(items)} overdue item(s){'' if sent else ' (email failed)'}")
+        lines.extend(f"    - {description or 'Item'} (barcode {barcode}), due {expected_return_date}"
+                     for barcode, description, expected_return_date in items)
+
+    total = sum(len(items) for (to_email, items), sent in digests)
+    # The digests are already sent and ledgered; a failed summary mustn't abort the run
+    try:
+        response = post_message(
+            MAILGUN_TO_EMAIL,
+            f"Overdue summary: {total} item(s) across {len(digests)} employee(s)",
+            "\n".join(lines),
+            session
+        )
+    except requests.RequestException as e:
+        logger.warning("Failed to send admin summary: %s", e)
+        return None
+
+    if response.status_code != 200:
+        logger.warning("Failed to send admin summary. Status code: %s, Response: %s", response.status_code, response.text)
+    return response
+
+
+# Function to run send calls concurrently over one pooled session
+# jobs is a list of argument tuples for send; yields (job, response) as each finishes,
+# with response None if the request failed outright
+def send_concurrently(send, jobs, max_workers=NOTIFY_MAX_WORKERS):
+    session = get_session()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(send, *job, session=session): job for job in jobs}
+
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                response = future.result()
+            except requests.RequestException as e:
+                logger.warning("Failed to send email for %s: %s", job, e)
+                response = None
+            yield job, response
+
+
+# Function to send many per-item notifications concurrently
+# notifications is a list of (barcode, expected_return_date, to_email) tuples
+def send_notifications(notifications, max_workers=NOTIFY_MAX_WORKERS):
+    return send_concurrently(send_notification, notifications, max_workers)
+
 
-    return response
\ No newline at end of file
+# Function to send many per-employee digests concurrently
+# digests is a list of (to_email, items) tuples, as taken by send_digest
+def send_digests(digests, max_workers=NOTIFY_MAX_WORKERS):
+    return send_concurrently(send_digest, digests, max_workers)
@@ -0,0 +1,92 @@
+import bisect
+import hashlib
+import json
+import threading
+
+# Most employees returned per page of a directory search
+SEARCH_PAGE_SIZE = 50
+
+# In-process cache of the active-employee directory. It is rebuilt only when
+# app_meta.employees_version changes; triggers bump that on every write to employees,
+# whichever process makes it.
+_cache = None
+_cache_lock = threading.Lock()
+
+
+# Function to read the directory version (one primary-key lookup)
+def get_directory_version(conn):
+    row = conn.execute("SELECT value FROM app_meta WHERE key = 'employees_version'").fetchone()
+    return row[0] if row else 0
+
+
+# Function to get the cached directory, reloading it if employees changed since it was built
+# Returns a dict with version, employees (Select2 options for active employees), names
+# (employee id as stored in inventory.checked_out_by -> name, inactive employees included),
+# json (serialized employees), etag, and search_keys (sorted (prefix key, position) pairs)
+def get_directory(conn):
+    global _cache
+    version = get_directory_version(conn)
+
+    cache = _cache
+    if cache is not None and cache['version'] == version:
+        return cache
+
+    with _cache_lock:
+        if _cache is not None and _cache['version'] == version:
+            return _cache
+
+        all_rows = conn.execute('SELECT id, name, email, active FROM employees ORDER BY name').fetchall()
+        rows = [emp for emp in all_rows if emp['active']]
+
+        # Format data for Select2: id, text, and active status
+        employees = [{'id': emp['id'], 'text': f"{emp['name']} ({emp['email']})", 'active': 1} for emp in rows]
+
+        # Every word of the name and the email are searchable by prefix
+        search_keys = []
+        for position, emp in enumerate(rows):
+            for key in emp['name'].lower().split() + [emp['email'].lower()]:
+                search_keys.append((key, position))
+        search_keys.sort()
+
+        body = json.dumps(employees)
+        _cache = {
+            'version': version,
+            'employees': employees,
+            'names': {str(emp['id']): emp['name'] for emp in all_rows},
+            'json': body,
+            'etag': hashlib.sha1(body.encode()).hexdigest(),
+            'search_keys': search_keys
+        }
+        return _cache
+
+
+# Function to drop the cache, e.g. after writing employees on a connection that bypasses the triggers
+def invalidate_directory():
+    global _cache
+    with _cache_lock:
+        _cache = None
+
+
+# Function to search the directory by name-word or email prefix, in Select2's paginated format
+def search_directory(conn, query, page=1, page_size=SEARCH_PAGE_SIZE):
+    directory = get_directory(conn)
+    query = query.strip().lower()
+    page = max(page, 1)
+
+    if query:
+        # Binary search to the first key with this prefix, then walk forward
+        search_keys = directory['search_keys']
+        positions = set()
+        index = bisect.bisect_left(search_keys, (query,))
+        while index < len(search_keys) and search_keys[index][0].startswith(query):
+            positions.add(search_keys[index][1])
+            index += 1
+        matches = [directory['employees'][position] for position in sorted(positions)]
+    else:
+        matches = directory['employees']
+
+    start = (page - 1) * page_size
+    return {
+        'results': matches[start:start + page_size],
+        'pagination': {'more': start + page_size < len(matches)}
+    }
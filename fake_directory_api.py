@@ -0,0 +1,62 @@
+#!/usr/bin/python3
+
+import json
+import sys
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+# Local stand-in for the staff directory API, for trying update_employees_table.py.
+#
+#   python3 fake_directory_api.py staff.json 8026     # serve records from a JSON fixture file
+#   python3 fake_directory_api.py 10000 8026          # or N generated staff records
+#   API_URL=http://localhost:8026/staff python3 update_employees_table.py
+#
+# Pages are served WordPress REST style: ?per_page=&page= with an X-WP-TotalPages header.
+
+RECORDS = []
+
+
+# Function to generate n directory records in the API's shape
+def generate_records(n):
+    return [{'acf': {'av_inventory': True, 'staff_name': f"Staff Member {i}", 'email_address': f"staff{i}@example.org"}}
+            for i in range(n)]
+
+
+class FakeDirectoryHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        params = parse_qs(urlparse(self.path).query)
+        per_page = int(params.get('per_page', ['100'])[0])
+        page = int(params.get('page', ['1'])[0])
+        total_pages = max(1, -(-len(RECORDS) // per_page))
+
+        if page > total_pages:
+            status, body = 400, json.dumps({'code': 'rest_post_invalid_page_number'}).encode()
+        else:
+            status, body = 200, json.dumps(RECORDS[(page - 1) * per_page:page * per_page]).encode()
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('X-WP-Total', str(len(RECORDS)))
+        self.send_header('X-WP-TotalPages', str(total_pages))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == "__main__":
+    source = sys.argv[1] if len(sys.argv) > 1 else '100'
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 8026
+
+    if source.isdigit():
+        RECORDS = generate_records(int(source))
+    else:
+        with open(source) as f:
+            RECORDS = json.load(f)
+
+    print(f"Fake directory API serving {len(RECORDS)} records on http://localhost:{port}/")
+    ThreadingHTTPServer(('', port), FakeDirectoryHandler).serve_forever()
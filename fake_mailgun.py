@@ -0,0 +1,53 @@
+#!/usr/bin/python3
+
+import random
+import sys
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs
+
+# Local stand-in for the Mailgun messages API, for trying notification runs without sending email.
+#
+#   python3 fake_mailgun.py 8025 0.2
+#   MAILGUN_API_BASE=http://localhost:8025/v3 python3 check_overdue_items.py
+#
+# The optional second argument is the fraction of requests answered with 429 or 503,
+# to exercise the dispatcher's retry and backoff.
+
+FAILURE_RATE = 0.0
+
+
+class FakeMailgunHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like the real API
+    announce = True  # Print each accepted message
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        form = parse_qs(self.rfile.read(length).decode())
+
+        if random.random() < FAILURE_RATE:
+            status = random.choice([429, 503])
+            body = b'{"message": "Try again later"}'
+        else:
+            status = 200
+            body = b'{"id": "<fake@localhost>", "message": "Queued. Thank you."}'
+            if self.announce:
+                print(f"Accepted message to {form.get('to', ['?'])[0]}: {form.get('subject', ['?'])[0]}")
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if status == 429:
+            self.send_header('Retry-After', '1')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # The accepted-message line above is enough
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8025
+    FAILURE_RATE = float(sys.argv[2]) if len(sys.argv) > 2 else 0.0
+
+    print(f"Fake Mailgun listening on http://localhost:{port}/v3 (failure rate {FAILURE_RATE})")
+    ThreadingHTTPServer(('', port), FakeMailgunHandler).serve_forever()
@@ -0,0 +1,317 @@
+#!/usr/bin/python3
+
+import argparse
+import csv
+import heapq
+import itertools
+import json
+import shutil
+import sys
+import tempfile
+import time
+
+from app_logging import configure_logging
+from db import connect
+from log_archive import history_stores
+from message_bus import append_event, MESSAGE_BUS
+from migrations import migrate
+
+# Bulk import of items and employees, and streaming export of inventory and checkout_log.
+#
+#   python3 import_export.py import items catalog.csv
+#   python3 import_export.py import employees staff.jsonl
+#   python3 import_export.py export inventory inventory.csv
+#   python3 import_export.py export checkout_log - --format jsonl --since 2024-01-01
+#
+# The format comes from the file extension (.csv or .jsonl), or --format for stdin/stdout.
+# Imports are upserts applied in chunked transactions, so the app keeps scanning meanwhile;
+# the whole input is checked first, so a bad line stops the import before anything is written.
+# With MESSAGE_BUS=outbox each chunk tells running apps which cached descriptions to drop;
+# on the local bus they keep the ones already cached until they restart.
+
+# Rows per import transaction
+IMPORT_CHUNK_SIZE = 5000
+
+# Rows fetched from SQLite at a time while exporting
+EXPORT_FETCH_SIZE = 1000
+
+# Each export is its columns and a function giving one (query, params) per store, each ordered
+# by the first column. checkout_log reads the hot log and the archive separately, in id order
+# off their primary keys, and export_table merges them, so the export streams from the first row.
+EXPORTS = {
+    'inventory': (
+        ['barcode', 'description', 'status', 'checked_out_by', 'checked_out_by_name',
+         'expected_return_date', 'checkout_timestamp'],
+        lambda conn, since: [('''
+            SELECT i.barcode, i.description, i.status, i.checked_out_by, e.name AS checked_out_by_name,
+                   i.expected_return_date, i.checkout_timestamp
+            FROM inventory i
+            LEFT JOIN employees e ON e.id = i.checked_out_by  -- 'system' and other non-ids match nothing
+            ORDER BY i.id
+        ''', {})]
+    ),
+    'checkout_log': (
+        ['id', 'barcode', 'checked_out_by', 'timestamp', 'action', 'expected_return_date'],
+        lambda conn, since: [(f'''
+            SELECT id, barcode, checked_out_by, timestamp, action, expected_return_date
+            FROM {store}.checkout_log
+            WHERE timestamp >= :since
+            ORDER BY id
+        ''', {'since': since or ''}) for store in history_stores(conn)]
+    ),
+}
+
+
+# Function to pick csv or jsonl from --format or the file name
+def detect_format(path, fmt):
+    if fmt:
+        return fmt
+    if path.endswith('.csv'):
+        return 'csv'
+    if path.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    raise ValueError(f"Can't tell the format of '{path}'; pass --format csv or --format jsonl")
+
+
+# Function to read records (dicts) from a CSV file with a header row, or from JSON lines
+# Yields (line number, record)
+def read_records(f, fmt):
+    if fmt == 'csv':
+        reader = csv.DictReader(f)
+        for record in reader:
+            yield reader.line_num, record
+    else:
+        for line_num, line in enumerate(f, 1):
+            if line.strip():
+                try:
+                    yield line_num, json.loads(line)
+                except ValueError:
+                    raise ValueError(f"Line {line_num}: invalid JSON") from None
+
+
+# Function to turn item records into (barcode, description) rows
+def parse_items(records):
+    for line_num, record in records:
+        barcode = str(record.get('barcode') or '').strip()
+        if not barcode:
+            raise ValueError(f"Line {line_num}: missing barcode")
+        description = record.get('description')
+        yield barcode, description.strip() if isinstance(description, str) and description.strip() else None
+
+
+# Function to turn employee records into (name, email, active) rows
+def parse_employees(records):
+    for line_num, record in records:
+        name = str(record.get('name') or '').strip()
+        email = str(record.get('email') or '').strip()
+        if not name or not email:
+            raise ValueError(f"Line {line_num}: name and email are required")
+        active = record.get('active', 1)
+        if isinstance(active, str):
+            active = active.strip().lower() not in ('0', 'false', 'no', '')
+        yield name, email, 1 if active else 0
+
+
+# Function to open an import input for two passes (check, then import); stdin is spooled to a temp file
+def open_import(path):
+    if path != '-':
+        return open(path, newline='', encoding='utf-8')
+    f = tempfile.TemporaryFile('w+', newline='', encoding='utf-8')
+    shutil.copyfileobj(sys.stdin, f)
+    f.seek(0)
+    return f
+
+
+# Function to parse every row of an import without writing, so a bad line fails the whole
+# import up front rather than after earlier chunks have committed; returns the row count
+def check_import(f, fmt, parse):
+    count = sum(1 for _ in parse(read_records(f, fmt)))
+    f.seek(0)
+    return count
+
+
+# Function to split rows into lists of at most size rows
+def chunked(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# Function to upsert items: new barcodes are created 'in' with a 'create' log row (like a
+# first scan), existing items get the new description; a blank description changes nothing
+def import_items(conn, rows, chunk_size=IMPORT_CHUNK_SIZE):
+    cursor = conn.cursor()
+    cursor.execute('CREATE TEMP TABLE IF NOT EXISTS import_items (barcode TEXT PRIMARY KEY, description TEXT)')
+    cursor.execute('CREATE TEMP TABLE IF NOT EXISTS import_new (barcode TEXT PRIMARY KEY)')
+
+    summary = {'added': 0, 'updated': 0, 'rows': 0}
+    for chunk in chunked(rows, chunk_size):
+        timestamp = time.strftime('%Y-%m-%d %H:%M:%S')
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            cursor.execute('DELETE FROM temp.import_items')
+            cursor.execute('DELETE FROM temp.import_new')
+            cursor.executemany('INSERT OR REPLACE INTO temp.import_items (barcode, description) VALUES (?, ?)', chunk)
+
+            if MESSAGE_BUS == 'outbox':
+                changed = [row[0] for row in cursor.execute('''
+                    SELECT i.barcode FROM inventory i JOIN temp.import_items s ON s.barcode = i.barcode
+                    WHERE s.description IS NOT NULL AND i.description IS NOT s.description
+                ''').fetchall()]
+                if changed:
+                    append_event(cursor, 'invalidate_items', {'barcodes': changed}, 'import_export')
+
+            cursor.execute('''
+                UPDATE inventory SET description = s.description
+                FROM temp.import_items s
+                WHERE inventory.barcode = s.barcode
+                AND s.description IS NOT NULL AND inventory.description IS NOT s.description
+            ''')
+            summary['updated'] += cursor.rowcount
+
+            cursor.execute('''
+                INSERT INTO temp.import_new (barcode)
+                SELECT barcode FROM temp.import_items WHERE barcode NOT IN (SELECT barcode FROM inventory)
+            ''')
+            summary['added'] += cursor.rowcount
+
+            cursor.execute('''
+                INSERT INTO inventory (barcode, status, checked_out_by, expected_return_date, checkout_timestamp, description)
+                SELECT s.barcode, 'in', 'system', 'N/A', :timestamp, s.description
+                FROM temp.import_items s JOIN temp.import_new n ON n.barcode = s.barcode
+            ''', {'timestamp': timestamp})
+            cursor.execute('''
+                INSERT INTO checkout_log (barcode, checked_out_by, timestamp, action)
+                SELECT barcode, 'system', :timestamp, 'create' FROM temp.import_new
+            ''', {'timestamp': timestamp})
+            cursor.execute('''
+                UPDATE inventory
+                SET last_log_id = (SELECT MAX(l.id) FROM checkout_log l WHERE l.barcode = inventory.barcode)
+                WHERE barcode IN (SELECT barcode FROM temp.import_new)
+            ''')
+            cursor.execute('''
+                INSERT INTO item_rollup (barcode, last_action, last_action_at)
+                SELECT barcode, 'create', :timestamp FROM temp.import_new WHERE true
+                ON CONFLICT (barcode) DO NOTHING
+            ''', {'timestamp': timestamp})
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        summary['rows'] += len(chunk)
+
+    return summary
+
+
+# Function to upsert employees by email (name and active flag are updated when they differ)
+def import_employees(conn, rows, chunk_size=IMPORT_CHUNK_SIZE):
+    cursor = conn.cursor()
+    summary = {'added': 0, 'updated': 0, 'rows': 0}
+    for chunk in chunked(rows, chunk_size):
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            before = cursor.execute('SELECT COUNT(*) FROM employees').fetchone()[0]
+            cursor.executemany('''
+                INSERT INTO employees (name, email, active) VALUES (?, ?, ?)
+                ON CONFLICT (email) DO UPDATE SET name = excluded.name, active = excluded.active
+                WHERE name IS NOT excluded.name OR active IS NOT excluded.active
+            ''', chunk)
+            changed = cursor.rowcount  # Inserted plus updated rows
+            added = cursor.execute('SELECT COUNT(*) FROM employees').fetchone()[0] - before
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        summary['added'] += added
+        summary['updated'] += changed - added
+        summary['rows'] += len(chunk)
+
+    return summary
+
+
+# Function to read a query's rows EXPORT_FETCH_SIZE at a time, as tuples
+def fetch_rows(conn, query, params):
+    cursor = conn.execute(query, params)
+    while True:
+        rows = cursor.fetchmany(EXPORT_FETCH_SIZE)
+        if not rows:
+            return
+        yield from (tuple(row) for row in rows)
+
+
+# Function to merge per-store row streams on their first column, writing a row left in both
+# stores by an interrupted archive run once
+def merge_rows(streams):
+    last_key = None
+    for row in heapq.merge(*streams, key=lambda row: row[0]):
+        if row[0] != last_key:
+            last_key = row[0]
+            yield row
+
+
+# Function to stream a table to f as CSV or JSON lines; returns the number of rows written
+def export_table(conn, table, f, fmt, since=None):
+    columns, build_queries = EXPORTS[table]
+    streams = [fetch_rows(conn, query, params) for query, params in build_queries(conn, since)]
+    rows = merge_rows(streams) if len(streams) > 1 else streams[0]
+
+    if fmt == 'csv':
+        writer = csv.writer(f)
+        writer.writerow(columns)
+
+    count = 0
+    for batch in chunked(rows, EXPORT_FETCH_SIZE):
+        if fmt == 'csv':
+            writer.writerows(batch)
+        else:
+            f.writelines(json.dumps(dict(zip(columns, row))) + '\n' for row in batch)
+        count += len(batch)
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import items and employees; export inventory and history.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = subparsers.add_parser('import', help="upsert items or employees from CSV/JSONL")
+    import_parser.add_argument('kind', choices=['items', 'employees'])
+    import_parser.add_argument('path', help="input file, or - for stdin")
+    import_parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE,
+                               help=f"rows per transaction (default {IMPORT_CHUNK_SIZE})")
+
+    export_parser = subparsers.add_parser('export', help="stream inventory or checkout_log to CSV/JSONL")
+    export_parser.add_argument('table', choices=sorted(EXPORTS))
+    export_parser.add_argument('path', help="output file, or - for stdout")
+    export_parser.add_argument('--since', help="checkout_log only: rows on or after this date (YYYY-MM-DD)")
+
+    for subparser in (import_parser, export_parser):
+        subparser.add_argument('--format', choices=['csv', 'jsonl'], help="default: from the file extension")
+    args = parser.parse_args()
+
+    configure_logging()
+    conn = connect()
+    migrate(conn)
+    start = time.perf_counter()
+
+    try:
+        fmt = detect_format(args.path, args.format)
+        if args.command == 'import':
+            parse, apply = (parse_items, import_items) if args.kind == 'items' else (parse_employees, import_employees)
+            with open_import(args.path) as f:
+                check_import(f, fmt, parse)
+                summary = apply(conn, parse(read_records(f, fmt)), args.chunk_size)
+            print(f"Imported {summary['rows']} {args.kind} in {time.perf_counter() - start:.1f}s: "
+                  f"{summary['added']} added, {summary['updated']} updated.")
+        else:
+            f = sys.stdout if args.path == '-' else open(args.path, 'w', newline='', encoding='utf-8')
+            with f:
+                count = export_table(conn, args.table, f, fmt, args.since)
+            print(f"Exported {count} {args.table} rows in {time.perf_counter() - start:.1f}s.", file=sys.stderr)
+    except (OSError, ValueError) as e:
+        print(f"Failed: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        conn.close()
@@ -0,0 +1,292 @@
+import base64
+import json
+import logging
+import os
+from itertools import groupby
+
+from app_logging import debug_rows
+from db import connect, get_db_connection
+import log_archive
+from migrations import migrate
+
+logger = logging.getLogger(__name__)
+
+# Data access and domain logic shared by the web app, the cron jobs and the benchmarks.
+# Importing this module has no side effects and pulls in neither Flask, evdev nor the
+# mail client, so command-line jobs start quickly; app.py adds the web and scanner layers.
+
+
+# Function to create or upgrade the database schema in place
+def initialize_database():
+    conn = connect()
+    applied = migrate(conn)
+    if applied:
+        logger.info("Applied database migrations %s.", applied)
+    else:
+        logger.info("Database schema is up to date.")
+
+    # Bring an existing archive up to date here, so read paths only ever attach it
+    # (read at call time, so a caller that moves ARCHIVE_DB_PATH, like the benchmarks, is honored)
+    if os.path.exists(log_archive.ARCHIVE_DB_PATH):
+        log_archive.prepare_archive(conn)
+    conn.close()
+
+
+# Function to record an action in checkout_log and point the item at it
+# Must run on the same cursor (and transaction) as the rest of the write
+# expected_return_date is the due date given with a checkout (kept for the usage analytics)
+def log_item_action(cursor, barcode, action, checked_out_by, timestamp, expected_return_date=None):
+    cursor.execute('INSERT INTO checkout_log (barcode, action, checked_out_by, timestamp, expected_return_date) VALUES (?, ?, ?, ?, ?)',
+                   (barcode, action, checked_out_by, timestamp, expected_return_date if action == 'checkout' else None))
+    # checkout_timestamp mirrors the log row so the dashboard can sort on an inventory index
+    cursor.execute('UPDATE inventory SET last_log_id = ?, checkout_timestamp = ? WHERE barcode = ?',
+                   (cursor.lastrowid, timestamp, barcode))
+    # Keep the item's rollup current (same rules as migrations.backfill_item_rollup)
+    cursor.execute('''
+        INSERT INTO item_rollup (barcode, last_action, last_action_at, total_checkouts, total_seconds_out, out_since)
+        VALUES (?, ?, ?, ?, 0, ?)
+        ON CONFLICT (barcode) DO UPDATE SET
+            last_action = excluded.last_action,
+            last_action_at = excluded.last_action_at,
+            total_checkouts = total_checkouts + excluded.total_checkouts,
+            total_seconds_out = total_seconds_out + CASE
+                WHEN excluded.last_action = 'checkin' AND last_action = 'checkout'
+                THEN strftime('%s', excluded.last_action_at) - strftime('%s', last_action_at) ELSE 0 END,
+            out_since = excluded.out_since
+    ''', (barcode, action, timestamp, 1 if action == 'checkout' else 0, timestamp if action == 'checkout' else None))
+
+
+def get_inventory_data():
+    conn = get_db_connection()
+    
+    items = conn.execute('''
+        SELECT 
+            i.description,
+            i.barcode, 
+            i.status, 
+            e.name AS checked_out_by,  -- Get employee name instead of ID
+            l.timestamp AS checkout_timestamp,
+            i.expected_return_date  -- Include expected return date
+        FROM 
+            inventory i
+        LEFT JOIN 
+            checkout_log l ON l.id = i.last_log_id  -- Latest log row, maintained on every insert
+        LEFT JOIN 
+            employees e ON l.checked_out_by = e.id  -- Join with employees table to get employee name
+        ORDER BY 
+            l.timestamp DESC  -- Same order as the dashboard so deltas can be placed on top
+    ''').fetchall()
+    
+    # Debug: Log a sample of the raw items fetched from the database
+    debug_rows(logger, "Inventory row", items)
+
+    # Convert to a list of dictionaries for easier manipulation on the client
+    inventory_items = []
+    for item in items:
+        inventory_items.append({
+            'barcode': item['barcode'],
+            'description': item['description'],
+            'status': item['status'],
+            'checked_out_by': item['checked_out_by'] if item['checked_out_by'] else 'N/A',  # Handle NULL values
+            'checkout_timestamp': item['checkout_timestamp'] if item['checkout_timestamp'] else 'N/A',  # Handle NULL values
+            'expected_return_date': item['expected_return_date'] if item['expected_return_date'] else 'N/A'  # Handle NULL values
+        })
+
+    return {'items': inventory_items}  # Return as a dictionary with 'items' key for consistency
+
+
+# Dashboard sort orders: the expression each one sorts on (ties are broken by i.id)
+# Expressions must match the indexes created by migration 4 exactly
+INVENTORY_SORT_KEYS = {
+    'timestamp': "IFNULL(i.checkout_timestamp, '')",
+    'status': 'i.status',
+    'expected_return_date': "IFNULL(i.expected_return_date, '9999-12-31')",  # No return date sorts last
+}
+
+# Dashboard filters
+INVENTORY_FILTERS = {
+    'all': '1 = 1',
+    'out': "i.status = 'out'",
+    'overdue': "i.status = 'out' AND i.expected_return_date < DATE('now')",
+}
+
+INVENTORY_PAGE_SIZE = 100
+INVENTORY_MAX_PAGE_SIZE = 500
+
+
+# Functions to turn a page's last (sort key, id) into an opaque cursor and back
+# (also used for history pages, where the sort key is the log timestamp)
+def encode_inventory_cursor(sort_key, item_id):
+    return base64.urlsafe_b64encode(json.dumps([sort_key, item_id]).encode()).decode()
+
+
+def decode_inventory_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        value = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        # Only a [sort key, id] pair that encode_inventory_cursor could have produced is bound into the query
+        if not isinstance(value, list) or len(value) != 2:
+            raise ValueError("not a [sort key, id] pair")
+        sort_key, item_id = value
+        if sort_key is not None and (isinstance(sort_key, bool) or not isinstance(sort_key, (str, int, float))):
+            raise ValueError("sort key is not a string or number")
+        if isinstance(item_id, bool) or not isinstance(item_id, int):
+            raise ValueError("id is not an integer")
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Malformed cursor: {cursor}") from e
+    return sort_key, item_id
+
+
+# Function to get one page of inventory using keyset (cursor) pagination
+# Cost depends on the page size, not on how deep into the catalog the page is
+def get_inventory_page(sort='timestamp', order='desc', status_filter='all', limit=INVENTORY_PAGE_SIZE, cursor=None):
+    sort_expr = INVENTORY_SORT_KEYS[sort]
+    direction = 'DESC' if order == 'desc' else 'ASC'
+    comparison = '<' if order == 'desc' else '>'
+
+    where = [INVENTORY_FILTERS[status_filter]]
+    params = []
+    if cursor is not None:
+        # The single-column bound lets SQLite seek the index; the row value breaks ties on id
+        where.append(f'{sort_expr} {comparison}= ? AND ({sort_expr}, i.id) {comparison} (?, ?)')
+        params.extend([cursor[0], cursor[0], cursor[1]])
+    params.append(limit + 1)
+
+    conn = get_db_connection()
+    rows = conn.execute(f'''
+        SELECT 
+            i.id,
+            {sort_expr} AS sort_key,
+            i.description,
+            i.barcode, 
+            i.status, 
+            e.name AS checked_out_by,
+            l.timestamp AS checkout_timestamp,
+            i.expected_return_date
+        FROM 
+            inventory i
+        LEFT JOIN 
+            checkout_log l ON l.id = i.last_log_id
+        LEFT JOIN 
+            employees e ON l.checked_out_by = e.id
+        WHERE 
+            {' AND '.join(where)}
+        ORDER BY 
+            {sort_expr} {direction}, i.id {direction}
+        LIMIT ?
+    ''', params).fetchall()
+
+    # One extra row tells us whether another page exists
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_inventory_cursor(rows[-1]['sort_key'], rows[-1]['id'])
+
+    items = []
+    for item in rows:
+        items.append({
+            'barcode': item['barcode'],
+            'description': item['description'],
+            'status': item['status'],
+            'checked_out_by': item['checked_out_by'] if item['checked_out_by'] else 'N/A',
+            'checkout_timestamp': item['checkout_timestamp'] if item['checkout_timestamp'] else 'N/A',
+            'expected_return_date': item['expected_return_date'] if item['expected_return_date'] else 'N/A'
+        })
+
+    return {'items': items, 'next_cursor': next_cursor}
+
+
+# Function to get the current state of a single item, in the same shape as get_inventory_data()
+def get_item_data(barcode):
+    conn = get_db_connection()
+
+    item = conn.execute('''
+        SELECT 
+            i.description,
+            i.barcode, 
+            i.status, 
+            e.name AS checked_out_by,
+            l.timestamp AS checkout_timestamp,
+            i.expected_return_date
+        FROM 
+            inventory i
+        LEFT JOIN 
+            checkout_log l ON l.id = i.last_log_id
+        LEFT JOIN 
+            employees e ON l.checked_out_by = e.id
+        WHERE 
+            i.barcode = ?
+    ''', (barcode,)).fetchone()
+
+    if item is None:
+        return None
+
+    return {
+        'barcode': item['barcode'],
+        'description': item['description'],
+        'status': item['status'],
+        'checked_out_by': item['checked_out_by'] if item['checked_out_by'] else 'N/A',
+        'checkout_timestamp': item['checkout_timestamp'] if item['checkout_timestamp'] else 'N/A',
+        'expected_return_date': item['expected_return_date'] if item['expected_return_date'] else 'N/A'
+    }
+
+
+# Function to check if items are overdue and send an email
+# digest=True sends each employee one email listing all their overdue items instead of one per item;
+# admin_summary=True (digest mode only) also emails MAILGUN_TO_EMAIL a summary of the run
+def check_overdue_items(digest=False, admin_summary=False):
+    # Imported here so the web app and other jobs don't load requests and .env until they send mail
+    from email_notifications import send_notifications, send_digests, send_admin_summary
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    # Query to get overdue items and the email of the person who checked them out,
+    # skipping any already recorded in notification_log for the same due date.
+    # Ordered by email so digest mode can group the rows per employee in this single pass
+    overdue_items = cursor.execute('''
+        SELECT i.barcode, i.description, i.expected_return_date, e.email
+        FROM inventory i
+        JOIN employees e ON i.checked_out_by = e.id
+        LEFT JOIN notification_log n
+            ON n.barcode = i.barcode AND n.email = e.email AND n.expected_return_date = i.expected_return_date
+        WHERE i.status = 'out' 
+        AND i.expected_return_date < DATE('now')  -- Sargable: ISO dates compare as text, uses the (status, expected_return_date) index
+        AND n.id IS NULL
+        ORDER BY e.email, i.expected_return_date
+    ''').fetchall()
+
+    # Function to record delivered items so an interrupted or repeated run never re-sends them
+    def record_sent(email, items):
+        cursor.executemany('INSERT OR IGNORE INTO notification_log (barcode, email, expected_return_date) VALUES (?, ?, ?)',
+                           [(barcode, email, expected_return_date) for barcode, expected_return_date in items])
+        conn.commit()
+
+    sent = 0
+    if digest:
+        digests = [(email, [(item['barcode'], item['description'], item['expected_return_date']) for item in items])
+                   for email, items in groupby(overdue_items, key=lambda item: item['email'])]
+
+        # One email per employee, sent concurrently
+        results = []
+        for (email, items), response in send_digests(digests):
+            delivered = response is not None and response.status_code == 200
+            if delivered:
+                record_sent(email, [(barcode, expected_return_date) for barcode, description, expected_return_date in items])
+                sent += len(items)
+            results.append(((email, items), delivered))
+
+        if admin_summary and results:
+            send_admin_summary(results)
+        logger.info("Overdue digests: %d employee(s), %d item(s) sent, %d failed.", len(digests), sent, len(overdue_items) - sent)
+    else:
+        notifications = [(item['barcode'], item['expected_return_date'], item['email']) for item in overdue_items]
+
+        # Send email notifications concurrently
+        for (barcode, expected_return_date, email), response in send_notifications(notifications):
+            if response is not None and response.status_code == 200:
+                record_sent(email, [(barcode, expected_return_date)])
+                sent += 1
+
+        logger.info("Overdue notifications: %d sent, %d failed.", sent, len(notifications) - sent)
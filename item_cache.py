@@ -0,0 +1,100 @@
+import os
+import threading
+from collections import OrderedDict
+
+# Most items kept in memory; least recently used items are evicted beyond this
+ITEM_CACHE_SIZE = int(os.getenv("ITEM_CACHE_SIZE", "10000"))
+
+# Columns of inventory kept per item
+ITEM_STATE_COLUMNS = ('barcode', 'status', 'checked_out_by', 'expected_return_date', 'description')
+
+
+# Function to read one item's state from the database, or None if the barcode is unknown
+def load_item_state(conn, barcode):
+    item = conn.execute(f"SELECT {', '.join(ITEM_STATE_COLUMNS)} FROM inventory WHERE barcode = ?", (barcode,)).fetchone()
+    return dict(item) if item else None
+
+
+# Bounded barcode -> item state map with LRU eviction.
+# Writers keep it current by calling put() after they commit (write-through);
+# readers call get() and only touch the database on a miss.
+class ItemStateCache:
+    def __init__(self, maxsize=ITEM_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+        self.generation = 0  # Bumped by every put() and invalidate(), so a miss can tell it raced one
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # Function to get an item's state, loading it with load_item_state on a miss
+    # Unknown barcodes are not cached, since a scan is about to create them. The loaded row is
+    # only cached if no write went through while it was read; otherwise it may be older than
+    # what that writer put, and the next get() loads again.
+    def get(self, conn, barcode):
+        with self.lock:
+            state = self.items.get(barcode)
+            if state is not None:
+                self.items.move_to_end(barcode)
+                self.hits += 1
+                return state
+            self.misses += 1
+            generation = self.generation
+
+        state = load_item_state(conn, barcode)
+        if state is not None:
+            with self.lock:
+                if self.generation == generation:
+                    self.store(barcode, state)
+        return state
+
+    # Function to store an item's new state (call after the write commits)
+    def put(self, barcode, state):
+        with self.lock:
+            self.generation += 1
+            self.store(barcode, state)
+
+    # Function to insert or refresh an entry and evict beyond maxsize; call with the lock held
+    def store(self, barcode, state):
+        self.items[barcode] = state
+        self.items.move_to_end(barcode)
+        while len(self.items) > self.maxsize:
+            self.items.popitem(last=False)
+            self.evictions += 1
+
+    # Function to drop an item, e.g. when it was written somewhere that doesn't update the cache
+    def invalidate(self, barcode=None):
+        with self.lock:
+            self.generation += 1
+            if barcode is None:
+                self.items.clear()
+            else:
+                self.items.pop(barcode, None)
+
+    # Function to preload the most recently active items
+    def warm(self, conn, limit=None):
+        rows = conn.execute(f'''
+            SELECT {', '.join(ITEM_STATE_COLUMNS)}
+            FROM inventory
+            ORDER BY IFNULL(checkout_timestamp, '') DESC  -- Served by idx_inventory_sort_timestamp
+            LIMIT ?
+        ''', (limit or self.maxsize,)).fetchall()
+
+        # Insert oldest first so the most recent items end up least likely to be evicted
+        for row in reversed(rows):
+            self.put(row['barcode'], dict(row))
+        return len(rows)
+
+    # Function to snapshot the hit/miss counters
+    def get_metrics(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.items),
+                'capacity': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0
+            }
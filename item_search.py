@@ -0,0 +1,37 @@
+import re
+
+# Items returned by a search, and the most a caller may ask for
+SEARCH_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+
+# Relative weight of a match in each inventory_search column, for bm25()
+BARCODE_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 4.0
+HOLDER_WEIGHT = 1.0
+
+
+# Function to turn what a user typed into an FTS5 MATCH expression
+# Every word must match the start of a word in some column; quoting keeps FTS5 syntax
+# characters in the input from being read as operators. Returns '' when there are no words.
+def build_match_query(text):
+    return ' '.join(f'"{word}"*' for word in re.findall(r'\w+', text.lower()))
+
+
+# Function to search items by barcode, description or the name of whoever has them out
+# An exact barcode comes first, then the best bm25 matches (barcode hits outrank description
+# hits, which outrank holder names)
+def search_items(conn, text, limit=SEARCH_LIMIT):
+    match = build_match_query(text)
+    if not match:
+        return []
+
+    return [dict(row) for row in conn.execute('''
+        SELECT i.barcode, i.description, i.status, i.expected_return_date, i.checkout_timestamp,
+               s.holder AS checked_out_by
+        FROM inventory_search s
+        JOIN inventory i ON i.id = s.rowid
+        WHERE inventory_search MATCH :match
+        ORDER BY i.barcode = :exact DESC, bm25(inventory_search, :barcode_weight, :description_weight, :holder_weight)
+        LIMIT :limit
+    ''', {'match': match, 'exact': text.strip(), 'limit': limit, 'barcode_weight': BARCODE_WEIGHT,
+          'description_weight': DESCRIPTION_WEIGHT, 'holder_weight': HOLDER_WEIGHT})]
@@ -0,0 +1,192 @@
+import logging
+import os
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+# checkout_log rows older than the retention horizon move to a separate archive database,
+# one calendar month at a time, so the hot log (and every query on it) stays small.
+# Item totals live on in item_rollup (see migrations.py); history reads go through
+# history_source(), which reads across both stores.
+
+# Archive database file; attached to hot connections as schema "archive"
+ARCHIVE_DB_PATH = os.getenv('ARCHIVE_DB_PATH', 'inventory_archive.db')
+
+# Days of checkout_log kept in the hot database; whole months older than this are archived
+LOG_RETENTION_DAYS = int(os.getenv('LOG_RETENTION_DAYS', '180'))
+
+# Rows moved per transaction, so the scanner writer is never blocked for long
+ARCHIVE_BATCH_SIZE = 10000
+
+LOG_COLUMNS = 'id, barcode, checked_out_by, timestamp, action, expected_return_date'
+
+
+# Function to attach the archive database to a connection for reading (must be outside a transaction)
+# Returns False when there is no archive yet; read paths then use the hot log alone.
+# This never writes: the archive's schema is set up by prepare_archive().
+def attach_archive(conn, path=None):
+    path = path or ARCHIVE_DB_PATH
+    if any(row[1] == 'archive' for row in conn.execute('PRAGMA database_list')):
+        return True
+    if not os.path.exists(path):
+        return False
+
+    conn.execute('ATTACH DATABASE ? AS archive', (path,))
+    if conn.execute("SELECT 1 FROM archive.sqlite_master WHERE type = 'table' AND name = 'checkout_log'").fetchone() is None:
+        conn.execute('DETACH DATABASE archive')
+        return False
+    return True
+
+
+# Function to create or upgrade the archive database and attach it (must be outside a transaction)
+# Run by the archiver and once at startup (initialize_database), never on request connections
+def prepare_archive(conn, path=None):
+    path = path or ARCHIVE_DB_PATH
+    if not any(row[1] == 'archive' for row in conn.execute('PRAGMA database_list')):
+        conn.execute('ATTACH DATABASE ? AS archive', (path,))
+    conn.execute('PRAGMA archive.journal_mode=WAL')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS archive.checkout_log (
+        id INTEGER PRIMARY KEY,  -- Same id the row had in the hot log
+        barcode TEXT NOT NULL,
+        checked_out_by TEXT NOT NULL,
+        timestamp DATETIME NOT NULL,
+        action TEXT NOT NULL,
+        month TEXT NOT NULL,  -- YYYY-MM of timestamp
+        expected_return_date DATETIME DEFAULT NULL
+    )
+    ''')
+    # Archives created before checkout_log had a due date column (migration 8)
+    if 'expected_return_date' not in [row[1] for row in conn.execute('PRAGMA archive.table_info(checkout_log)')]:
+        conn.execute('ALTER TABLE archive.checkout_log ADD COLUMN expected_return_date DATETIME DEFAULT NULL')
+    conn.execute('CREATE INDEX IF NOT EXISTS archive.idx_archive_log_barcode_timestamp ON checkout_log (barcode, timestamp)')
+    conn.execute('CREATE INDEX IF NOT EXISTS archive.idx_archive_log_month ON checkout_log (month)')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS archive.archived_months (
+        month TEXT PRIMARY KEY,
+        rows INTEGER NOT NULL DEFAULT 0,
+        archived_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    conn.commit()
+
+
+# Function to list the schemas holding checkout_log rows: main, plus archive once one exists
+def history_stores(conn):
+    return ['main', 'archive'] if attach_archive(conn) else ['main']
+
+
+# Function to get a FROM-clause source for checkout_log history across both stores
+# SQLite won't push an outer WHERE into a UNION, so the filter (with :named parameters) and an
+# optional ORDER BY ... LIMIT go into each store's arm, where they can use its indexes.
+# UNION (not UNION ALL) hides rows left in both stores by an interrupted archive run.
+def history_source(conn, where='1 = 1', order_limit=''):
+    arms = [f'SELECT * FROM (SELECT {LOG_COLUMNS} FROM {store}.checkout_log WHERE {where} {order_limit})'
+            for store in history_stores(conn)]
+    return '(' + ' UNION '.join(arms) + ')'
+
+
+# Function to list the months that have rows due for archiving (oldest first)
+# Rows archive_month() leaves hot (an item's last_log_id) don't count, so a month with only
+# those left isn't listed again on every run
+def months_to_archive(conn, retention_days=LOG_RETENTION_DAYS):
+    return [row[0] for row in conn.execute('''
+        SELECT DISTINCT substr(timestamp, 1, 7)
+        FROM main.checkout_log
+        WHERE timestamp < DATE('now', 'localtime', ?, 'start of month')
+        AND id NOT IN (SELECT last_log_id FROM inventory WHERE last_log_id IS NOT NULL)
+        ORDER BY 1
+    ''', (f'-{int(retention_days)} days',))]
+
+
+# Function to move one month of checkout_log into the archive, ARCHIVE_BATCH_SIZE rows per transaction
+# Rows an item's last_log_id points at stay hot, since the dashboard joins on them.
+# Each batch copies with INSERT OR IGNORE before deleting, so a rerun after a crash converges.
+def archive_month(conn, month, batch_size=ARCHIVE_BATCH_SIZE):
+    moved = 0
+    cursor = conn.cursor()
+    cursor.execute('CREATE TEMP TABLE IF NOT EXISTS archive_batch (id INTEGER PRIMARY KEY)')
+    while True:
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            cursor.execute('DELETE FROM temp.archive_batch')
+            cursor.execute('''
+                INSERT INTO temp.archive_batch (id)
+                SELECT id FROM main.checkout_log
+                WHERE timestamp >= DATE(:month || '-01') AND timestamp < DATE(:month || '-01', '+1 month')
+                AND id NOT IN (SELECT last_log_id FROM inventory WHERE last_log_id IS NOT NULL)
+                ORDER BY id
+                LIMIT :limit
+            ''', {'month': month, 'limit': batch_size})
+            count = cursor.rowcount
+            if count:
+                cursor.execute(f'''
+                    INSERT OR IGNORE INTO archive.checkout_log ({LOG_COLUMNS}, month)
+                    SELECT {LOG_COLUMNS}, ? FROM main.checkout_log WHERE id IN (SELECT id FROM temp.archive_batch)
+                ''', (month,))
+                cursor.execute('DELETE FROM main.checkout_log WHERE id IN (SELECT id FROM temp.archive_batch)')
+                cursor.execute('''
+                    INSERT INTO archive.archived_months (month, rows) VALUES (?, ?)
+                    ON CONFLICT (month) DO UPDATE SET rows = rows + excluded.rows, archived_at = CURRENT_TIMESTAMP
+                ''', (month, count))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+        moved += count
+        if count < batch_size:
+            return moved
+
+
+# Function to archive every whole month older than the retention horizon
+# A month that fails is logged and skipped, keeping the batches it already committed, and the
+# later months still run. Returns ({month: rows moved}, {month: error} for the failures)
+def archive_checkout_log(conn, retention_days=LOG_RETENTION_DAYS, archive_path=None):
+    prepare_archive(conn, archive_path)
+
+    results, failed = {}, {}
+    for month in months_to_archive(conn, retention_days):
+        try:
+            results[month] = archive_month(conn, month)
+        except sqlite3.Error as e:
+            failed[month] = str(e)
+            logger.error("Failed to archive checkout_log rows from %s: %s", month, e)
+            continue
+        logger.info("Archived %d checkout_log rows from %s.", results[month], month)
+    return results, failed
+
+
+# Function to get an item's lifetime totals from item_rollup (None if it has no history)
+# total_seconds_out includes the open loan, if the item is out
+def get_item_summary(conn, barcode):
+    row = conn.execute('''
+        SELECT barcode, last_action, last_action_at, total_checkouts, out_since,
+               total_seconds_out + IFNULL(strftime('%s', 'now', 'localtime') - strftime('%s', out_since), 0)
+                   AS total_seconds_out
+        FROM item_rollup
+        WHERE barcode = ?
+    ''', (barcode,)).fetchone()
+    return dict(row) if row else None
+
+
+# Function to get one page of an item's checkout_log rows from both stores, newest first
+# Keyset pagination on (timestamp, id): `before` is the last row's (timestamp, id) from the
+# previous page. Each store's (barcode, timestamp) index also orders by id (the rowid), so
+# every page is an index range scan however deep it is.
+def get_item_history(conn, barcode, limit=100, before=None):
+    where = 'barcode = :barcode'
+    params = {'barcode': barcode, 'limit': limit}
+    if before is not None:
+        # The single-column bound lets SQLite seek the index; the row value breaks ties on id
+        where += ' AND timestamp <= :timestamp AND (timestamp, id) < (:timestamp, :id)'
+        params.update(timestamp=before[0], id=before[1])
+
+    newest = 'ORDER BY timestamp DESC, id DESC LIMIT :limit'
+    return [dict(row) for row in conn.execute(f'''
+        SELECT h.id, h.barcode, h.action, h.timestamp, h.checked_out_by, e.name AS checked_out_by_name
+        FROM {history_source(conn, where, newest)} h
+        LEFT JOIN employees e ON e.id = h.checked_out_by
+        ORDER BY h.timestamp DESC, h.id DESC
+        LIMIT :limit
+    ''', params)]
@@ -0,0 +1,198 @@
+import json
+import logging
+import os
+import threading
+import uuid
+
+from db import connect, get_db_connection, run_db
+
+logger = logging.getLogger(__name__)
+
+# Which bus carries SocketIO events and cache invalidations between processes:
+#   local   - one web process that also reads the scanners (the default); events never leave it
+#   outbox  - any number of web workers plus the scanner process (scan_service.py), all sharing
+#             the database; events go through the event_outbox table (migration 10)
+MESSAGE_BUS = os.getenv('MESSAGE_BUS', 'local')
+
+# How often each process checks the outbox for new events (seconds); a check that finds nothing
+# is one PRAGMA, so this is mostly the added delivery latency
+OUTBOX_POLL_SECONDS = float(os.getenv('OUTBOX_POLL_SECONDS', '0.05'))
+
+# Events read per check
+OUTBOX_BATCH_SIZE = 500
+
+# Events kept in the outbox; a process further behind than this misses some, and its clients
+# resync when they see the gap in inventory versions
+OUTBOX_KEEP_ROWS = 10000
+
+# Prune the outbox once every this many events
+OUTBOX_PRUNE_EVERY = 1000
+
+
+# Function to append one event to the outbox in the caller's transaction; returns its id
+# Writers other than a bus (e.g. import_export.py) use this to reach every running process
+def append_event(cursor, event, payload, origin):
+    cursor.execute('INSERT INTO event_outbox (event, payload, origin) VALUES (?, ?, ?)',
+                   (event, json.dumps(payload), origin))
+    event_id = cursor.lastrowid
+    if event_id % OUTBOX_PRUNE_EVERY == 0:
+        cursor.execute('DELETE FROM event_outbox WHERE id <= ?', (event_id - OUTBOX_KEEP_ROWS,))
+    return event_id
+
+
+# Both buses: publish() sends an event to every subscriber in every process, in one global
+# order; publish_versioned() also numbers it as the next inventory version.
+# Subscribers are called as handler(event, payload, remote), remote being False for events
+# this bus published itself.
+class LocalBus:
+    def __init__(self):
+        self.handlers = []
+        self.version = 0
+        self.lock = threading.Lock()  # Held while delivering, so every subscriber sees one order
+        self.published = 0
+
+    def subscribe(self, handler):
+        self.handlers.append(handler)
+
+    # Nothing to poll; events are delivered as they are published
+    def start(self, start_task, sleep):
+        pass
+
+    # Function to get the inventory version of the last event published
+    def get_version(self, conn):
+        return self.version
+
+    def publish(self, event, payload):
+        with self.lock:
+            self.deliver(event, payload)
+
+    # build_payload() runs on the database executor once the version is taken, so the payload
+    # reflects at least every change numbered before it
+    def publish_versioned(self, event, build_payload):
+        with self.lock:
+            self.version += 1
+            self.deliver(event, dict(run_db(build_payload), version=self.version))
+
+    def deliver(self, event, payload):
+        self.published += 1
+        for handler in self.handlers:
+            handler(event, payload, False)
+
+    def get_metrics(self):
+        return {'published': self.published, 'delivered': self.published}
+
+
+# Bus between processes on one host, through the event_outbox table. Publishing is one small
+# write transaction; each process polls for events after the last one it delivered, checking
+# PRAGMA data_version first so an idle poll never reads the table.
+class OutboxBus:
+    def __init__(self, poll_interval=OUTBOX_POLL_SECONDS, batch_size=OUTBOX_BATCH_SIZE):
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.origin = uuid.uuid4().hex
+        self.handlers = []
+        self.conn = None  # The poller's own connection; data_version only counts other connections' commits
+        self.data_version = None
+        self.last_id = None
+
+        # Metrics, guarded by the lock
+        self.lock = threading.Lock()
+        self.published = 0
+        self.delivered = 0
+
+    def subscribe(self, handler):
+        self.handlers.append(handler)
+
+    # Function to start the poller; start_task and sleep come from the caller's concurrency model
+    # (socketio.start_background_task and socketio.sleep in the web app)
+    def start(self, start_task, sleep):
+        self.conn = connect()
+        self.last_id = self.conn.execute('SELECT IFNULL(MAX(id), 0) FROM event_outbox').fetchone()[0]
+        start_task(self.run_poller, sleep)
+
+    # Function to read the shared inventory version (one primary-key lookup)
+    def get_version(self, conn):
+        return conn.execute("SELECT value FROM app_meta WHERE key = 'inventory_version'").fetchone()[0]
+
+    def publish(self, event, payload):
+        run_db(self.append, event, lambda: payload, False)
+
+    # build_payload() runs inside the write transaction that takes the version, so a payload
+    # can never be older than one numbered before it, whichever process published that
+    def publish_versioned(self, event, build_payload):
+        run_db(self.append, event, build_payload, True)
+
+    # Function to write one event (runs on the database executor)
+    def append(self, event, build_payload, versioned):
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            payload = build_payload()
+            if versioned:
+                cursor.execute("UPDATE app_meta SET value = value + 1 WHERE key = 'inventory_version'")
+                payload = dict(payload, version=self.get_version(conn))
+            append_event(cursor, event, payload, self.origin)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        with self.lock:
+            self.published += 1
+
+    # Function to read the events after last_id, or [] when nothing has been committed since the last check
+    # (runs on the database executor, one call at a time)
+    def fetch_events(self):
+        data_version = self.conn.execute('PRAGMA data_version').fetchone()[0]
+        if data_version == self.data_version:
+            return []
+
+        rows = self.conn.execute('SELECT id, event, payload, origin FROM event_outbox WHERE id > ? ORDER BY id LIMIT ?',
+                                 (self.last_id, self.batch_size)).fetchall()
+        # A full batch may have left more behind; check again without waiting for another commit
+        if len(rows) < self.batch_size:
+            self.data_version = data_version
+        return rows
+
+    # Poller loop; started by start()
+    def run_poller(self, sleep):
+        while True:
+            try:
+                rows = run_db(self.fetch_events)
+            except Exception:
+                logger.exception("Failed to read the event outbox.")
+                rows = []
+
+            for row in rows:
+                if row['id'] != self.last_id + 1:
+                    logger.warning("Event outbox skipped from %d to %d; clients will resync.", self.last_id, row['id'])
+                self.last_id = row['id']
+                payload = json.loads(row['payload'])
+                for handler in self.handlers:
+                    try:
+                        handler(row['event'], payload, row['origin'] != self.origin)
+                    except Exception:
+                        logger.exception("Failed to handle %s from the event outbox.", row['event'])
+                with self.lock:
+                    self.delivered += 1
+
+            if len(rows) < self.batch_size:
+                sleep(self.poll_interval)
+
+    def get_metrics(self):
+        with self.lock:
+            return {'published': self.published, 'delivered': self.delivered}
+
+
+BUSES = {
+    'local': LocalBus,
+    'outbox': OutboxBus,
+}
+
+
+# Function to create the bus named by MESSAGE_BUS
+def get_message_bus(name=None):
+    name = name or MESSAGE_BUS
+    if name not in BUSES:
+        raise ValueError(f"Unknown MESSAGE_BUS {name!r}; expected one of {', '.join(BUSES)}.")
+    return BUSES[name]()
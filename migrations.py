@@ -0,0 +1,352 @@
+import logging
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+# Schema migrations, applied in order and tracked with PRAGMA user_version.
+# Each migration runs in its own transaction together with the version bump,
+# so an interrupted upgrade leaves the database at the last completed version.
+# Never edit a released migration; append a new one instead.
+
+
+# Migration 1: the original tables from setup_database.py
+# IF NOT EXISTS lets databases created before versioning adopt version 1 in place
+def create_base_tables(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS inventory (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        barcode TEXT NOT NULL UNIQUE,
+        status TEXT NOT NULL CHECK (status IN ('in', 'out')),
+        checked_out_by TEXT,  -- Column for the name of the person checking out
+        checkout_timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,  -- Column for the checkout timestamp
+        expected_return_date DATETIME DEFAULT NULL,
+        description TEXT DEFAULT NULL  -- Description of the item
+    )
+    ''')
+
+    # Create the checkout_log table to track check-ins and check-outs
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS checkout_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        barcode TEXT NOT NULL,
+        checked_out_by TEXT NOT NULL,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        action TEXT NOT NULL CHECK (action IN ('checkout', 'checkin', 'create')),
+        FOREIGN KEY (barcode) REFERENCES inventory(barcode)
+    )
+    ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS employees (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        email TEXT NOT NULL UNIQUE,
+        active INTEGER DEFAULT 1
+    )
+    ''')
+
+
+# Function to point every inventory row at its latest checkout_log entry
+# Ties on timestamp are broken by the log id
+def backfill_last_log_id(cursor):
+    cursor.execute('''
+        UPDATE inventory
+        SET last_log_id = (
+            SELECT l.id
+            FROM checkout_log l
+            WHERE l.barcode = inventory.barcode
+            ORDER BY l.timestamp DESC, l.id DESC
+            LIMIT 1
+        )
+    ''')
+    return cursor.rowcount
+
+
+# Migration 2: inventory.last_log_id, the denormalized pointer to the latest log row
+def add_last_log_id(cursor):
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(inventory)")]
+    if 'last_log_id' not in columns:
+        cursor.execute("ALTER TABLE inventory ADD COLUMN last_log_id INTEGER DEFAULT NULL")
+    backfill_last_log_id(cursor)
+
+
+# Migration 3: indexes for the hot queries
+def add_hot_query_indexes(cursor):
+    # Per-item history and latest-row lookups; the rowid (id) rides along as the tie-breaker
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_checkout_log_barcode_timestamp ON checkout_log (barcode, timestamp)')
+
+    # Time-range scans over the whole log
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_checkout_log_timestamp ON checkout_log (timestamp)')
+
+    # Overdue scan: status = 'out' AND expected_return_date < DATE('now')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_inventory_status_return_date ON inventory (status, expected_return_date)')
+
+    # Employee directory listing (active employees by name)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_employees_active_name ON employees (active, name)')
+
+
+# Migration 4: keyset pagination indexes for the dashboard's sort orders
+# The expressions must match INVENTORY_SORT_KEYS in inventory_core.py exactly for SQLite to use them
+def add_inventory_sort_indexes(cursor):
+    # checkout_timestamp now mirrors the latest log row's timestamp; align rows written before that
+    cursor.execute('''
+        UPDATE inventory
+        SET checkout_timestamp = (SELECT l.timestamp FROM checkout_log l WHERE l.id = inventory.last_log_id)
+        WHERE last_log_id IS NOT NULL
+    ''')
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_inventory_sort_timestamp ON inventory (IFNULL(checkout_timestamp, ''))")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_inventory_sort_return_date ON inventory (IFNULL(expected_return_date, '9999-12-31'))")
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_inventory_sort_status ON inventory (status)')
+
+
+# Migration 5: ledger of overdue notifications already sent, so reruns never re-email
+# One row per (item, recipient, due date); a new checkout with a new due date notifies again
+def add_notification_log(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS notification_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        barcode TEXT NOT NULL,
+        email TEXT NOT NULL,
+        expected_return_date DATETIME NOT NULL,
+        sent_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE (barcode, email, expected_return_date)
+    )
+    ''')
+
+
+# Migration 6: employees_version counter, bumped by triggers on every employees change
+# The web app's cached employee directory compares it on each request; because triggers
+# bump it, add_employee.py, remove_employee.py and update_employees_table.py invalidate
+# the cache from their own processes without talking to the app
+def add_employees_version(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS app_meta (
+        key TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    )
+    ''')
+    cursor.execute("INSERT OR IGNORE INTO app_meta (key, value) VALUES ('employees_version', 1)")
+
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS employees_version_after_{event.lower()}
+        AFTER {event} ON employees
+        BEGIN
+            UPDATE app_meta SET value = value + 1 WHERE key = 'employees_version';
+        END
+        ''')
+
+
+# Function to rebuild item_rollup from the rows in checkout_log
+# Time out is summed over each checkout followed directly by a checkin; an item whose last
+# action is a checkout keeps that timestamp in out_since. Only sees the hot log, so run it
+# before any rows are archived (see log_archive.py).
+def backfill_item_rollup(cursor):
+    cursor.execute('DELETE FROM item_rollup')
+    cursor.execute('''
+        INSERT INTO item_rollup (barcode, last_action, last_action_at, total_checkouts, total_seconds_out, out_since)
+        SELECT
+            barcode,
+            MAX(CASE WHEN next_action IS NULL THEN action END),
+            MAX(CASE WHEN next_action IS NULL THEN timestamp END),
+            SUM(action = 'checkout'),
+            SUM(CASE WHEN action = 'checkout' AND next_action = 'checkin'
+                     THEN strftime('%s', next_timestamp) - strftime('%s', timestamp) ELSE 0 END),
+            MAX(CASE WHEN next_action IS NULL AND action = 'checkout' THEN timestamp END)
+        FROM (
+            SELECT barcode, action, timestamp,
+                   LEAD(action) OVER w AS next_action,
+                   LEAD(timestamp) OVER w AS next_timestamp
+            FROM checkout_log
+            WINDOW w AS (PARTITION BY barcode ORDER BY timestamp, id)
+        )
+        GROUP BY barcode
+    ''')
+    return cursor.rowcount
+
+
+# Migration 7: per-item rollup of the checkout history, kept in the hot database so item
+# totals survive checkout_log rows being moved to the archive
+def add_item_rollup(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS item_rollup (
+        barcode TEXT PRIMARY KEY,
+        last_action TEXT NOT NULL,
+        last_action_at DATETIME NOT NULL,
+        total_checkouts INTEGER NOT NULL DEFAULT 0,
+        total_seconds_out INTEGER NOT NULL DEFAULT 0,  -- Completed loans only
+        out_since DATETIME DEFAULT NULL  -- Start of the open loan, if checked out
+    )
+    ''')
+    backfill_item_rollup(cursor)
+
+
+# Migration 8: analytics rollups (see analytics.py)
+# checkout_log now records the due date given at checkout, so overdue returns can be counted
+# after the item's own expected_return_date has moved on; older rows leave it NULL.
+# Daily rollups: checkouts by checkout day, completed loans (time out, late returns) by return day.
+def add_usage_rollups(cursor):
+    columns = [row[1] for row in cursor.execute('PRAGMA table_info(checkout_log)')]
+    if 'expected_return_date' not in columns:
+        cursor.execute('ALTER TABLE checkout_log ADD COLUMN expected_return_date DATETIME DEFAULT NULL')
+
+    for table, key in (('usage_daily_items', 'barcode'), ('usage_daily_employees', 'employee_id')):
+        cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS {table} (
+            day TEXT NOT NULL,
+            {key} TEXT NOT NULL,
+            checkouts INTEGER NOT NULL DEFAULT 0,
+            loans_returned INTEGER NOT NULL DEFAULT 0,
+            seconds_out INTEGER NOT NULL DEFAULT 0,
+            overdue_returns INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, {key})
+        ) WITHOUT ROWID
+        ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS usage_daily_hours (
+        day TEXT NOT NULL,
+        hour INTEGER NOT NULL,
+        checkouts INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, hour)
+    ) WITHOUT ROWID
+    ''')
+
+    # Loans still open at the last refresh (times in seconds since the epoch, local time)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS usage_open_loans (
+        barcode TEXT PRIMARY KEY,
+        employee_id TEXT NOT NULL,
+        started_at INTEGER NOT NULL,
+        due_at INTEGER DEFAULT NULL
+    )
+    ''')
+
+    # Last checkout_log id folded into the rollups
+    cursor.execute("INSERT OR IGNORE INTO app_meta (key, value) VALUES ('usage_log_id', 0)")
+
+
+# Migration 9: FTS5 search index over each item's barcode, description and current holder
+# (see item_search.py). Rows share inventory's id as their rowid; triggers keep them in
+# step with inventory and with employee renames, whichever process writes.
+def add_inventory_search(cursor):
+    cursor.execute('''
+    CREATE VIRTUAL TABLE IF NOT EXISTS inventory_search USING fts5 (
+        barcode, description, holder,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+    ''')
+
+    # The holder is only set while the item is out
+    holder = "CASE WHEN new.status = 'out' THEN (SELECT name FROM employees WHERE id = new.checked_out_by) END"
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS inventory_search_after_insert
+    AFTER INSERT ON inventory
+    BEGIN
+        INSERT INTO inventory_search (rowid, barcode, description, holder)
+        VALUES (new.id, new.barcode, new.description, {holder});
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS inventory_search_after_update
+    AFTER UPDATE OF barcode, description, status, checked_out_by ON inventory
+    WHEN old.barcode IS NOT new.barcode OR old.description IS NOT new.description
+        OR old.status IS NOT new.status OR old.checked_out_by IS NOT new.checked_out_by
+    BEGIN
+        UPDATE inventory_search SET barcode = new.barcode, description = new.description, holder = {holder}
+        WHERE rowid = new.id;
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS inventory_search_after_delete
+    AFTER DELETE ON inventory
+    BEGIN
+        DELETE FROM inventory_search WHERE rowid = old.id;
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS inventory_search_after_employee_rename
+    AFTER UPDATE OF name ON employees
+    WHEN old.name IS NOT new.name
+    BEGIN
+        UPDATE inventory_search SET holder = new.name
+        WHERE rowid IN (SELECT id FROM inventory WHERE status = 'out' AND checked_out_by = new.id);
+    END
+    ''')
+
+    cursor.execute('DELETE FROM inventory_search')
+    cursor.execute('''
+        INSERT INTO inventory_search (rowid, barcode, description, holder)
+        SELECT i.id, i.barcode, i.description, CASE WHEN i.status = 'out' THEN e.name END
+        FROM inventory i
+        LEFT JOIN employees e ON e.id = i.checked_out_by
+    ''')
+
+
+# Migration 10: event_outbox, the SQLite-polled message bus between processes (see message_bus.py)
+# Every web worker and the scanner process append events and read back everyone's in id order;
+# app_meta.inventory_version numbers the item_changed events across all of them
+def add_event_outbox(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS event_outbox (
+        id INTEGER PRIMARY KEY,
+        event TEXT NOT NULL,
+        payload TEXT NOT NULL,  -- JSON
+        origin TEXT NOT NULL  -- The publishing bus, so a process can tell its own events apart
+    )
+    ''')
+    cursor.execute("INSERT OR IGNORE INTO app_meta (key, value) VALUES ('inventory_version', 0)")
+
+
+MIGRATIONS = [
+    (1, 'create base tables', create_base_tables),
+    (2, 'add inventory.last_log_id', add_last_log_id),
+    (3, 'add hot query indexes', add_hot_query_indexes),
+    (4, 'add inventory sort indexes', add_inventory_sort_indexes),
+    (5, 'add notification_log', add_notification_log),
+    (6, 'add employees_version', add_employees_version),
+    (7, 'add item_rollup', add_item_rollup),
+    (8, 'add usage rollups', add_usage_rollups),
+    (9, 'add inventory_search', add_inventory_search),
+    (10, 'add event_outbox', add_event_outbox),
+]
+
+# The schema version this code expects
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+# Function to read the schema version recorded in the database file
+def get_schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+# Function to bring a database up to SCHEMA_VERSION; returns the list of applied versions
+def migrate(conn):
+    current = get_schema_version(conn)
+    if current > SCHEMA_VERSION:
+        raise RuntimeError(f"Database schema version {current} is newer than this code ({SCHEMA_VERSION}).")
+
+    applied = []
+    for version, name, apply in MIGRATIONS:
+        if version <= current:
+            continue
+
+        logger.info("Applying migration %d: %s...", version, name)
+        cursor = conn.cursor()
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            apply(cursor)
+            # PRAGMA values cannot be bound as parameters; version is an int from MIGRATIONS
+            cursor.execute(f'PRAGMA user_version = {int(version)}')
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        applied.append(version)
+
+    # Let the query planner see the new indexes' statistics
+    if applied:
+        conn.execute('PRAGMA optimize')
+    return applied
@@ -0,0 +1,118 @@
+import logging
+import queue
+import threading
+import time
+from collections import namedtuple
+
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+# Scans waiting for the writer; when full the reader blocks and the kernel buffers keystrokes
+SCAN_QUEUE_SIZE = 256
+
+# Most scans handled in one writer transaction
+SCAN_BATCH_SIZE = 32
+
+SCAN_TO_EMIT_SECONDS = Histogram('inventory_scan_to_emit_seconds',
+                                 'Time from a scanner finishing a barcode to its SocketIO event being queued for clients',
+                                 ['station'])
+
+# A completed barcode, the station whose scanner read it, and when the reader finished it (time.monotonic())
+Scan = namedtuple('Scan', ['barcode', 'station', 'enqueued_at'])
+
+
+# Two-stage scan ingestion: reader threads only assemble barcodes and submit() them;
+# a single writer thread drains the queue and hands each batch to handle_batch,
+# which does the database work in one transaction and publishes the SocketIO events.
+class ScanPipeline:
+    def __init__(self, handle_batch, maxsize=SCAN_QUEUE_SIZE, batch_size=SCAN_BATCH_SIZE):
+        self.handle_batch = handle_batch
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=maxsize)
+
+        # Metrics, guarded by the lock
+        self.lock = threading.Lock()
+        self.scans_submitted = 0
+        self.scans_by_station = {}
+        self.scans_processed = 0
+        self.batches = 0
+        self.errors = 0
+        self.backpressure_waits = 0
+        self.max_queue_depth = 0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+        self.total_latency = 0.0
+
+    # Function called by a reader for each completed barcode
+    def submit(self, barcode, station=None):
+        scan = Scan(barcode, station, time.monotonic())
+        try:
+            self.queue.put_nowait(scan)
+        except queue.Full:
+            # Backpressure: stall the reader until the writer catches up rather than drop a scan
+            with self.lock:
+                self.backpressure_waits += 1
+            logger.warning("Scan queue full (%d); reader waiting on the writer.", self.queue.maxsize)
+            self.queue.put(scan)
+
+        with self.lock:
+            self.scans_submitted += 1
+            self.scans_by_station[station] = self.scans_by_station.get(station, 0) + 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+
+    # Function to take the next batch: block for one scan, then take whatever else is already queued
+    def next_batch(self):
+        batch = [self.queue.get()]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    # Writer loop; run it in its own thread
+    def run_writer(self):
+        while True:
+            batch = self.next_batch()
+            try:
+                self.handle_batch(batch)
+            except Exception:
+                # Keep the writer alive; the scans in this batch are lost and must be rescanned
+                with self.lock:
+                    self.errors += 1
+                logger.exception("Failed to process %d scan(s) %s", len(batch), [scan.barcode for scan in batch])
+                continue
+
+            # handle_batch has published its events by now (see broadcaster.py for the fan-out)
+            now = time.monotonic()
+            with self.lock:
+                self.batches += 1
+                for scan in batch:
+                    latency = now - scan.enqueued_at
+                    self.scans_processed += 1
+                    self.total_latency += latency
+                    self.last_latency = latency
+                    self.max_latency = max(self.max_latency, latency)
+            for scan in batch:
+                SCAN_TO_EMIT_SECONDS.observe(now - scan.enqueued_at, station=scan.station or '')
+
+    # Function to snapshot the metrics as a plain dict (latencies in milliseconds)
+    def get_metrics(self):
+        with self.lock:
+            return {
+                'queue_depth': self.queue.qsize(),
+                'queue_capacity': self.queue.maxsize,
+                'max_queue_depth': self.max_queue_depth,
+                'scans_submitted': self.scans_submitted,
+                'scans_by_station': dict(self.scans_by_station),
+                'scans_processed': self.scans_processed,
+                'batches': self.batches,
+                'errors': self.errors,
+                'backpressure_waits': self.backpressure_waits,
+                'latency_ms': {
+                    'last': round(self.last_latency * 1000, 3),
+                    'avg': round(self.total_latency / self.scans_processed * 1000, 3) if self.scans_processed else 0.0,
+                    'max': round(self.max_latency * 1000, 3)
+                }
+            }
@@ -0,0 +1,143 @@
+#!/usr/bin/python3
+
+import logging
+import threading
+import time
+
+from app_logging import configure_logging
+from db import get_db_connection, release_db_connection, run_db
+from employee_directory import get_directory
+from inventory_core import get_item_data, initialize_database, log_item_action
+from item_cache import ItemStateCache
+from message_bus import get_message_bus, MESSAGE_BUS
+from scan_pipeline import ScanPipeline
+
+logger = logging.getLogger(__name__)
+
+# Scan ingestion: turns batches from the scan pipeline into database writes and bus events.
+# By default app.py reads the scanners itself; to run them in their own process, next to any
+# number of web workers, use the outbox bus everywhere and start the web workers with
+# SCANNER_PROCESS=separate:
+#
+#   MESSAGE_BUS=outbox python3 scan_service.py
+
+
+# Function to publish a changed item to every process as the next inventory version
+def publish_item_changed(bus, barcode):
+    bus.publish_versioned('item_changed', lambda: {'item': get_item_data(barcode)})
+
+
+# Function to keep an item cache current with changes made by other processes
+# (a bus subscriber; this process's own writes already wrote through)
+def invalidate_on_change(item_cache, event, payload, remote):
+    if event == 'invalidate_items':
+        for barcode in payload['barcodes']:
+            item_cache.invalidate(barcode)
+    elif event == 'item_changed' and remote and payload['item']:
+        item_cache.invalidate(payload['item']['barcode'])
+
+
+class ScanIngestor:
+    def __init__(self, item_cache, bus):
+        self.item_cache = item_cache
+        self.bus = bus
+
+    # Function to apply a batch of scans from the scan pipeline (runs on the writer thread)
+    # The database work runs on the executor; events are published in scan order after commit
+    def ingest(self, scans):
+        for event, scan, payload in run_db(self.apply, scans):
+            if event == 'item_changed':
+                publish_item_changed(self.bus, scan.barcode)
+            else:
+                self.bus.publish('barcode_scanned', payload)
+
+    # Function to write a batch of scans in one transaction
+    # Returns (event, scan, payload) for each scan; item_changed payloads are built when published
+    def apply(self, scans):
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        timestamp = time.strftime('%Y-%m-%d %H:%M:%S')
+
+        events = []
+        created = []
+        try:
+            for scan in scans:
+                # Check if the item already exists (items created earlier in this batch are visible on this connection)
+                item = self.item_cache.get(conn, scan.barcode)
+
+                if item:
+                    # If the item exists, emit barcode to client-side to trigger the modal
+                    events.append(('barcode_scanned', scan))
+                else:
+                    # If the item doesn't exist, create it with default values
+                    cursor.execute(
+                        'INSERT INTO inventory (barcode, status, checked_out_by, expected_return_date) VALUES (?, ?, ?, ?)',
+                        (scan.barcode, 'in', 'system', 'N/A')
+                    )
+                    log_item_action(cursor, scan.barcode, 'create', 'system', timestamp)
+                    created.append(scan.barcode)
+                    events.append(('item_changed', scan))
+                    logger.debug("New item %s added to inventory.", scan.barcode)
+
+            conn.commit()
+        except Exception:
+            # A duplicate scan in this batch may have cached a row that is now rolled back
+            conn.rollback()
+            for barcode in created:
+                self.item_cache.invalidate(barcode)
+            raise
+
+        for barcode in created:
+            self.item_cache.put(barcode, {'barcode': barcode, 'status': 'in', 'checked_out_by': 'system',
+                                          'expected_return_date': 'N/A', 'description': None})
+
+        return [(event, scan, self.get_scan_payload(conn, scan) if event == 'barcode_scanned' else None)
+                for event, scan in events]
+
+    # Function to build the barcode_scanned payload: everything the kiosk needs to open the
+    # right modal without calling back, from the item and directory caches (memory reads when warm)
+    def get_scan_payload(self, conn, scan):
+        item = self.item_cache.get(conn, scan.barcode)
+        directory = get_directory(conn)
+
+        return {
+            'barcode': scan.barcode,
+            'station': scan.station,
+            'item': {
+                'barcode': scan.barcode,
+                'status': item['status'],
+                'description': item['description'],
+                'checked_out_by': directory['names'].get(str(item['checked_out_by']), 'N/A'),
+                'expected_return_date': item['expected_return_date'] or 'N/A'
+            },
+            # The kiosk drops its cached employee searches when this changes
+            'employees_version': directory['version']
+        }
+
+
+# Function to start a daemon thread (the scanner process's start_task for the bus poller)
+def start_thread(target, *args):
+    threading.Thread(target=target, args=args, daemon=True).start()
+
+
+if __name__ == "__main__":
+    configure_logging()
+    if MESSAGE_BUS == 'local':
+        raise SystemExit("scan_service.py publishes to the web workers through the outbox; run it with MESSAGE_BUS=outbox.")
+    initialize_database()
+
+    item_cache = ItemStateCache()
+    bus = get_message_bus()
+    bus.subscribe(lambda event, payload, remote: invalidate_on_change(item_cache, event, payload, remote))
+    bus.start(start_thread, time.sleep)
+
+    # Preload the most recently active items so the first scans are memory reads
+    logger.info("Warmed item cache with %d items.", item_cache.warm(get_db_connection()))
+    release_db_connection()
+
+    # evdev is only needed here; see SCANNERS in scanners.py
+    from scanners import ScannerHub
+    pipeline = ScanPipeline(ScanIngestor(item_cache, bus).ingest)
+    threading.Thread(target=pipeline.run_writer, daemon=True).start()
+    logger.info("Ready to scan items (%s bus)...", MESSAGE_BUS)
+    ScannerHub(pipeline).run()
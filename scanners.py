@@ -0,0 +1,151 @@
+import logging
+import os
+import select
+import time
+
+import evdev
+
+logger = logging.getLogger(__name__)
+
+# Which input devices are barcode scanners, and the station each one belongs to.
+# Comma-separated "station=matcher" entries, checked in order; a matcher is one of
+#   name:<text>             the device name contains <text> (case-insensitive)
+#   usb:<vendor>:<product>  USB vendor/product id in hex, e.g. usb:0c2e:0b61
+#   path:<device node>      e.g. path:/dev/input/event3
+# Example: SCANNERS="front-desk=usb:0c2e:0b61,warehouse=name:barcode"
+SCANNERS = os.getenv('SCANNERS', 'default=path:/dev/input/event3')
+
+# Seconds between checks for scanners plugged in (or back in) at runtime
+RESCAN_INTERVAL = float(os.getenv('SCANNER_RESCAN_INTERVAL', '2'))
+
+SHIFT_KEYS = ('KEY_LEFTSHIFT', 'KEY_RIGHTSHIFT')
+
+
+# Function to parse SCANNERS into a list of (station, kind, value) tuples
+def parse_scanner_specs(spec):
+    specs = []
+    for entry in spec.split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        station, _, matcher = entry.partition('=')
+        kind, _, value = matcher.partition(':')
+        if kind not in ('name', 'usb', 'path') or not value:
+            raise ValueError(f"Invalid scanner spec '{entry}'; expected station=name:<text>, station=usb:<vendor>:<product> or station=path:<node>")
+        if kind == 'usb':
+            vendor, _, product = value.partition(':')
+            value = (int(vendor, 16), int(product, 16))
+        specs.append((station.strip(), kind, value))
+    return specs
+
+
+# Function to return the station a device belongs to, or None if it is not a scanner
+def match_station(device, specs):
+    for station, kind, value in specs:
+        if kind == 'name' and value.lower() in device.name.lower():
+            return station
+        if kind == 'usb' and (device.info.vendor, device.info.product) == value:
+            return station
+        if kind == 'path' and device.path == value:
+            return station
+    return None
+
+
+# Reads every matching scanner from one select() loop, so there is no thread per device.
+# Scanners can come and go at runtime; each completed barcode is submitted to the
+# scan pipeline tagged with the station of the scanner it came from.
+class ScannerHub:
+    def __init__(self, pipeline, specs=None, rescan_interval=RESCAN_INTERVAL):
+        self.pipeline = pipeline
+        self.specs = specs if specs is not None else parse_scanner_specs(SCANNERS)
+        self.rescan_interval = rescan_interval
+
+        self.devices = {}    # fd -> InputDevice
+        self.stations = {}   # fd -> station name
+        self.barcodes = {}   # fd -> barcode assembled so far
+        self.ignored = set() # paths of input devices that are not scanners
+
+    # Function to open any newly attached scanners
+    def rescan(self):
+        paths = set(evdev.list_devices())
+        open_paths = {device.path for device in self.devices.values()}
+
+        # Forget devices that went away, in case the node is reused by a scanner
+        self.ignored &= paths
+
+        for path in paths - open_paths - self.ignored:
+            try:
+                device = evdev.InputDevice(path)
+            except OSError:
+                continue  # Not readable (permissions) or vanished mid-scan
+
+            station = match_station(device, self.specs)
+            if station is None:
+                device.close()
+                self.ignored.add(path)
+                continue
+
+            logger.info("Scanner connected: %s %s (station %s)", device.path, device.name, station)
+            self.devices[device.fd] = device
+            self.stations[device.fd] = station
+            self.barcodes[device.fd] = ''
+
+    # Function to drop a scanner that was unplugged
+    def remove(self, fd):
+        device = self.devices.pop(fd)
+        logger.info("Scanner disconnected: %s (station %s)", device.path, self.stations.pop(fd))
+        self.barcodes.pop(fd)
+        try:
+            device.close()
+        except OSError:
+            pass
+
+    # Function to feed one input event from a scanner into its barcode buffer
+    def handle_event(self, fd, event):
+        if event.type != evdev.ecodes.EV_KEY:
+            return
+        key_event = evdev.categorize(event)
+        if key_event.keystate != key_event.key_down:
+            return
+
+        key = evdev.ecodes.KEY[key_event.scancode]
+        if isinstance(key, list):  # Some codes have several names
+            key = key[0]
+
+        # Ignore the Shift keys
+        if key in SHIFT_KEYS:
+            return
+
+        # When 'Enter' key is detected, barcode is complete
+        if key == 'KEY_ENTER':
+            if self.barcodes[fd]:
+                self.pipeline.submit(self.barcodes[fd], self.stations[fd])
+            self.barcodes[fd] = ''
+        elif key.startswith('KEY_'):
+            # Remove 'KEY_' prefix to get the character
+            char = key[len('KEY_'):].lower()
+            if len(char) == 1:  # If it's a single character
+                self.barcodes[fd] += char
+
+    # Reader loop; run it in its own thread
+    def run(self):
+        next_rescan = 0.0
+        while True:
+            if time.monotonic() >= next_rescan:
+                self.rescan()
+                next_rescan = time.monotonic() + self.rescan_interval
+
+            timeout = max(0.0, next_rescan - time.monotonic())
+            if not self.devices:
+                time.sleep(timeout)
+                continue
+
+            readable, _, _ = select.select(list(self.devices), [], [], timeout)
+            for fd in readable:
+                try:
+                    for event in self.devices[fd].read():
+                        self.handle_event(fd, event)
+                except BlockingIOError:
+                    continue  # Woken without a full event to read
+                except OSError:
+                    self.remove(fd)  # ENODEV: the scanner was unplugged
@@ -0,0 +1,136 @@
+import random
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from db import connect
+from migrations import migrate
+
+pytest.importorskip('numpy')
+import analytics  # noqa: E402
+
+
+# Function to make a migrated database for the rollups
+@pytest.fixture
+def conn(tmp_path):
+    conn = connect(str(tmp_path / 'inventory.db'))
+    migrate(conn)
+    yield conn
+    conn.close()
+
+
+# Function to generate log rows for a few items in id order, with strictly increasing timestamps
+# Mostly well-formed checkout/checkin pairs, plus repeated checkouts and stray checkins
+def generate_log(count, seed, start=datetime(2024, 3, 1, 8, 0, 0)):
+    rng = random.Random(seed)
+    at = start
+    out = {}
+    rows = []
+    for _ in range(count):
+        at += timedelta(seconds=rng.randint(60, 30000))
+        barcode = f'B{rng.randint(1, 8)}'
+        if barcode in out and rng.random() < 0.85:
+            action = 'checkin'
+        elif rng.random() < 0.9:
+            action = 'checkout'
+        else:
+            action = rng.choice(['checkin', 'create'])
+        employee = str(rng.randint(1, 5))
+        due = (at + timedelta(days=rng.randint(-1, 4))).strftime('%Y-%m-%d') if action == 'checkout' and rng.random() < 0.8 else None
+        if action == 'checkout':
+            out[barcode] = True
+        else:
+            out.pop(barcode, None)
+        rows.append((barcode, employee, at.strftime('%Y-%m-%d %H:%M:%S'), action, due))
+    return rows
+
+
+def insert_log(conn, rows):
+    conn.executemany('''
+        INSERT INTO checkout_log (barcode, checked_out_by, timestamp, action, expected_return_date) VALUES (?, ?, ?, ?, ?)
+    ''', rows)
+    conn.commit()
+
+
+# Function to compute the rollups row by row from the whole log: a checkout counts on its day;
+# a checkout directly followed (for the same item) by a checkin is a loan, booked on the return day
+def naive_rollups(rows):
+    items = defaultdict(lambda: [0, 0, 0, 0])
+    employees = defaultdict(lambda: [0, 0, 0, 0])
+    hours = defaultdict(int)
+
+    def seconds(timestamp):
+        return int(datetime.fromisoformat(timestamp).replace(tzinfo=timezone.utc).timestamp())
+
+    by_item = defaultdict(list)
+    for row in rows:
+        by_item[row[0]].append(row)
+
+    open_loans = set()
+    for barcode, events in by_item.items():
+        for index, (_, employee, timestamp, action, due) in enumerate(events):
+            if action == 'checkout':
+                items[(timestamp[:10], barcode)][0] += 1
+                employees[(timestamp[:10], employee)][0] += 1
+                hours[(timestamp[:10], int(timestamp[11:13]))] += 1
+
+            if index and action == 'checkin' and events[index - 1][3] == 'checkout':
+                _, borrower, started, _, due = events[index - 1]
+                late = 1 if due is not None and timestamp[:10] > due else 0
+                for totals in (items[(timestamp[:10], barcode)], employees[(timestamp[:10], borrower)]):
+                    totals[1] += 1
+                    totals[2] += seconds(timestamp) - seconds(started)
+                    totals[3] += late
+
+        last = events[-1]
+        if last[3] == 'checkout':
+            open_loans.add((barcode, last[1], seconds(last[2]), seconds(last[4]) if last[4] else None))
+
+    return ({key: tuple(value) for key, value in items.items()},
+            {key: tuple(value) for key, value in employees.items()},
+            dict(hours), open_loans)
+
+
+# Function to read the rollup tables back in the shape naive_rollups returns
+def stored_rollups(conn):
+    def totals(table, key):
+        return {(row['day'], row[key]): (row['checkouts'], row['loans_returned'], row['seconds_out'],
+                                         row['overdue_returns'])
+                for row in conn.execute(f'SELECT * FROM {table}')}
+
+    return (totals('usage_daily_items', 'barcode'), totals('usage_daily_employees', 'employee_id'),
+            {(row['day'], row['hour']): row['checkouts'] for row in conn.execute('SELECT * FROM usage_daily_hours')},
+            {tuple(row) for row in conn.execute('SELECT barcode, employee_id, started_at, due_at FROM usage_open_loans')})
+
+
+@pytest.mark.parametrize('chunk_rows', [1, 7, 100000])
+def test_rollups_match_naive_recomputation(conn, chunk_rows):
+    rows = generate_log(400, seed=chunk_rows)
+    insert_log(conn, rows)
+
+    assert analytics.refresh_usage_rollups(conn, chunk_rows) == len(rows)
+    assert stored_rollups(conn) == naive_rollups(rows)
+
+
+def test_incremental_refreshes_match_one_refresh(conn):
+    rows = generate_log(600, seed=3)
+    for start in range(0, len(rows), 150):
+        insert_log(conn, rows[start:start + 150])
+        analytics.refresh_usage_rollups(conn, chunk_rows=40)
+
+    assert analytics.refresh_usage_rollups(conn) == 0
+    assert stored_rollups(conn) == naive_rollups(rows)
+
+
+def test_report_items_caps_utilization(conn):
+    insert_log(conn, [('B1', '1', '2024-03-01 09:00:00', 'checkout', None),
+                      ('B1', '1', '2024-03-04 09:00:00', 'checkin', None),
+                      ('B2', '2', '2024-03-04 06:00:00', 'checkout', None),
+                      ('B2', '2', '2024-03-04 18:00:00', 'checkin', None)])
+    analytics.refresh_usage_rollups(conn)
+
+    report = {row['barcode']: row for row in analytics.report_items(conn, '2024-03-04', '2024-03-04')}
+    assert report['B1']['seconds_out'] == 3 * 86400
+    assert report['B1']['utilization'] == 1.0
+    assert report['B2']['utilization'] == 0.5
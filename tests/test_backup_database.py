@@ -0,0 +1,143 @@
+import gzip
+import os
+import sqlite3
+import time
+
+import pytest
+
+import backup_database
+from backup_database import DELTA_MAGIC, backup, list_backups, restore, rotate
+
+
+# Function to create a small database with some pages to change later
+@pytest.fixture
+def source_db(tmp_path):
+    path = str(tmp_path / 'inventory.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE items (id INTEGER PRIMARY KEY, body TEXT)')
+    conn.executemany('INSERT INTO items (body) VALUES (?)', [('x' * 200,) for _ in range(2000)])
+    conn.commit()
+    conn.close()
+    return path
+
+
+def dump(path):
+    conn = sqlite3.connect(path)
+    try:
+        return list(conn.iterdump())
+    finally:
+        conn.close()
+
+
+def change_rows(path, sql):
+    conn = sqlite3.connect(path)
+    conn.execute(sql)
+    conn.commit()
+    conn.close()
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_full_backup_round_trip(source_db, tmp_path, compress):
+    path = backup(source_db, str(tmp_path / 'backups'), compress=compress, keep=0)
+    assert path.endswith('.db.gz' if compress else '.db')
+
+    restore(path, str(tmp_path / 'restored.db'))
+    assert dump(str(tmp_path / 'restored.db')) == dump(source_db)
+
+
+@pytest.mark.parametrize('sql', [
+    "UPDATE items SET body = 'changed' WHERE id % 97 = 0",
+    "INSERT INTO items (body) SELECT body FROM items",  # Grows the file
+    "DELETE FROM items WHERE id > 100",
+])
+def test_incremental_backup_round_trip(source_db, tmp_path, sql):
+    backup_dir = str(tmp_path / 'backups')
+    backup(source_db, backup_dir, keep=0)
+    change_rows(source_db, sql)
+    if sql.startswith('DELETE'):
+        change_rows(source_db, 'VACUUM')  # Shrinks the file
+
+    path = backup(source_db, backup_dir, incremental=True, keep=0)
+    assert path.endswith('.delta.gz')
+
+    restore(path, str(tmp_path / 'restored.db'))
+    assert dump(str(tmp_path / 'restored.db')) == dump(source_db)
+
+
+def test_backups_taken_together_get_distinct_names(source_db, tmp_path):
+    backup_dir = str(tmp_path / 'backups')
+    paths = {backup(source_db, backup_dir, keep=0) for _ in range(3)}
+    assert len(paths) == 3
+
+
+def test_missing_database(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        backup(str(tmp_path / 'typo.db'), str(tmp_path / 'backups'))
+    assert not os.path.exists(tmp_path / 'typo.db')
+
+
+# Function to take a full and an incremental backup; returns the incremental's path and its decompressed bytes
+def incremental_backup(source_db, backup_dir):
+    backup(source_db, backup_dir, keep=0)
+    change_rows(source_db, "UPDATE items SET body = 'changed' WHERE id % 50 = 0")
+    path = backup(source_db, backup_dir, incremental=True, keep=0)
+    with gzip.open(path, 'rb') as f:
+        return path, f.read()
+
+
+@pytest.mark.parametrize('damage', ['truncated', 'no_trailer', 'bad_header', 'not_gzip', 'bad_page'])
+def test_corrupt_delta_leaves_output_untouched(source_db, tmp_path, damage):
+    path, raw = incremental_backup(source_db, str(tmp_path / 'backups'))
+    header_end = raw.index(b'\n', len(DELTA_MAGIC)) + 1
+    page_size = 4096
+
+    if damage == 'not_gzip':
+        with open(path, 'wb') as f:
+            f.write(b'garbage')
+    else:
+        if damage == 'truncated':
+            raw = raw[:header_end + 4 + page_size // 2]
+        elif damage == 'no_trailer':
+            raw = raw[:-36]
+        elif damage == 'bad_header':
+            raw = DELTA_MAGIC + b'{not json\n' + raw[header_end:]
+        elif damage == 'bad_page':
+            offset = header_end + 4 + 100  # Inside the first changed page
+            raw = raw[:offset] + bytes([raw[offset] ^ 0xFF]) + raw[offset + 1:]
+        with gzip.open(path, 'wb') as f:
+            f.write(raw)
+
+    output = tmp_path / 'restored.db'
+    output.write_bytes(b'previous contents')
+    with pytest.raises((ValueError, RuntimeError)):
+        restore(path, str(output))
+    assert output.read_bytes() == b'previous contents'
+    assert not os.path.exists(str(output) + '.partial')
+
+
+def test_rotate_keeps_incrementals_of_kept_full_backups(source_db, tmp_path):
+    backup_dir = str(tmp_path / 'backups')
+    first = os.path.basename(backup(source_db, backup_dir, keep=0))
+    first_delta = os.path.basename(backup(source_db, backup_dir, incremental=True, keep=0))
+    second = os.path.basename(backup(source_db, backup_dir, keep=0))
+    second_delta = os.path.basename(backup(source_db, backup_dir, incremental=True, keep=0))
+
+    assert sorted(rotate(source_db, backup_dir, keep=1)) == sorted([first, first_delta])
+    assert list_backups(source_db, backup_dir) == ([second], [second_delta])
+
+
+def test_rotate_removes_stale_temporary_files(source_db, tmp_path):
+    backup_dir = tmp_path / 'backups'
+    backup(source_db, str(backup_dir), keep=0)
+    stale = ['inventory_backup_1.snapshot', 'inventory_backup_2.db.gz.partial']
+    fresh = ['inventory_backup_3.snapshot', 'other_backup_4.snapshot']
+    for name in stale + fresh:
+        (backup_dir / name).write_bytes(b'')
+    old = time.time() - backup_database.BACKUP_STALE_SECONDS - 60
+    for name in stale + ['other_backup_4.snapshot']:
+        os.utime(backup_dir / name, (old, old))
+
+    rotate(source_db, str(backup_dir), keep=0)
+    remaining = set(os.listdir(backup_dir))
+    assert not remaining & set(stale)
+    assert set(fresh) <= remaining
@@ -0,0 +1,47 @@
+import base64
+import json
+
+import pytest
+
+from inventory_core import decode_inventory_cursor, encode_inventory_cursor
+
+
+# Function to build a cursor around an arbitrary JSON value, as a client could send
+def raw_cursor(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+
+@pytest.mark.parametrize('sort_key, item_id', [
+    ('2024-05-01 09:30:00', 42),
+    ('out', 1),
+    (None, 7),
+    (3.5, 0),
+    (12, 99),
+])
+def test_round_trip(sort_key, item_id):
+    assert decode_inventory_cursor(encode_inventory_cursor(sort_key, item_id)) == (sort_key, item_id)
+
+
+@pytest.mark.parametrize('cursor', [None, ''])
+def test_no_cursor(cursor):
+    assert decode_inventory_cursor(cursor) is None
+
+
+@pytest.mark.parametrize('cursor', [
+    'not base64!',
+    base64.urlsafe_b64encode(b'not json').decode(),
+    raw_cursor('x'),
+    raw_cursor({'sort_key': 'x', 'id': 1}),
+    raw_cursor(['x']),
+    raw_cursor(['x', 1, 2]),
+    raw_cursor([[1], 2]),
+    raw_cursor([{'a': 1}, 2]),
+    raw_cursor([True, 2]),
+    raw_cursor(['x', None]),
+    raw_cursor(['x', '1']),
+    raw_cursor(['x', 1.5]),
+    raw_cursor(['x', True]),
+])
+def test_malformed_cursor_raises_value_error(cursor):
+    with pytest.raises(ValueError):
+        decode_inventory_cursor(cursor)
@@ -0,0 +1,147 @@
+import sqlite3
+
+import pytest
+
+import migrations
+from db import connect
+from migrations import SCHEMA_VERSION, get_schema_version, migrate
+
+# The schema the original setup_database.py created, before migrations were versioned
+BASELINE_SCHEMA = '''
+CREATE TABLE inventory (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    barcode TEXT NOT NULL UNIQUE,
+    status TEXT NOT NULL CHECK (status IN ('in', 'out')),
+    checked_out_by TEXT,
+    checkout_timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+    expected_return_date DATETIME DEFAULT NULL,
+    description TEXT DEFAULT NULL
+);
+CREATE TABLE checkout_log (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    barcode TEXT NOT NULL,
+    checked_out_by TEXT NOT NULL,
+    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+    action TEXT NOT NULL CHECK (action IN ('checkout', 'checkin', 'create')),
+    FOREIGN KEY (barcode) REFERENCES inventory(barcode)
+);
+CREATE TABLE employees (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    email TEXT NOT NULL UNIQUE,
+    active INTEGER DEFAULT 1
+);
+'''
+
+# Tables every migrated database has
+EXPECTED_TABLES = {'inventory', 'checkout_log', 'employees', 'notification_log', 'app_meta', 'item_rollup',
+                   'usage_daily_items', 'usage_daily_employees', 'usage_daily_hours', 'usage_open_loans',
+                   'inventory_search', 'event_outbox'}
+
+
+# Function to open a connection to path the way the app does
+@pytest.fixture
+def open_db(tmp_path):
+    connections = []
+
+    def open_db(name='inventory.db'):
+        conn = connect(str(tmp_path / name))
+        connections.append(conn)
+        return conn
+
+    yield open_db
+    for conn in connections:
+        conn.close()
+
+
+def table_names(conn):
+    return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+
+def test_fresh_database(open_db):
+    conn = open_db()
+    assert migrate(conn) == list(range(1, SCHEMA_VERSION + 1))
+    assert get_schema_version(conn) == SCHEMA_VERSION
+    assert EXPECTED_TABLES <= table_names(conn)
+    assert conn.execute("SELECT value FROM app_meta WHERE key = 'inventory_version'").fetchone()[0] == 0
+
+    # Running again is a no-op
+    assert migrate(conn) == []
+
+
+def test_baseline_database(open_db):
+    conn = open_db()
+    conn.executescript(BASELINE_SCHEMA)
+    conn.executescript('''
+        INSERT INTO employees (name, email) VALUES ('Ada Lovelace', 'ada@example.org');
+        INSERT INTO inventory (barcode, status, checked_out_by, checkout_timestamp, expected_return_date, description)
+        VALUES ('A1', 'in', '1', '2024-01-01 09:00:00', NULL, 'Drill'),
+               ('B2', 'out', '1', '2024-01-01 09:00:00', '2024-01-09', 'Saw');
+        INSERT INTO checkout_log (barcode, checked_out_by, timestamp, action) VALUES
+            ('A1', 'system', '2024-01-01 08:00:00', 'create'),
+            ('A1', '1', '2024-01-02 09:00:00', 'checkout'),
+            ('A1', '1', '2024-01-02 11:00:00', 'checkin'),
+            ('B2', 'system', '2024-01-01 08:00:00', 'create'),
+            ('B2', '1', '2024-01-03 10:00:00', 'checkout');
+    ''')
+    assert get_schema_version(conn) == 0
+
+    assert migrate(conn) == list(range(1, SCHEMA_VERSION + 1))
+    assert get_schema_version(conn) == SCHEMA_VERSION
+    assert EXPECTED_TABLES <= table_names(conn)
+
+    # Existing rows are kept and backfilled
+    items = {row['barcode']: row for row in conn.execute('SELECT * FROM inventory')}
+    assert items['A1']['last_log_id'] == 3
+    assert items['B2']['last_log_id'] == 5
+    assert items['A1']['checkout_timestamp'] == '2024-01-02 11:00:00'
+    assert items['B2']['description'] == 'Saw'
+
+    rollup = {row['barcode']: row for row in conn.execute('SELECT * FROM item_rollup')}
+    assert (rollup['A1']['last_action'], rollup['A1']['total_checkouts'], rollup['A1']['total_seconds_out'],
+            rollup['A1']['out_since']) == ('checkin', 1, 7200, None)
+    assert (rollup['B2']['last_action'], rollup['B2']['total_checkouts'], rollup['B2']['out_since']) == \
+        ('checkout', 1, '2024-01-03 10:00:00')
+
+    # The search index covers the existing items, with the holder of the one checked out
+    matches = conn.execute("SELECT barcode FROM inventory_search WHERE inventory_search MATCH 'lovelace'").fetchall()
+    assert [row['barcode'] for row in matches] == ['B2']
+    assert conn.execute("SELECT COUNT(*) FROM inventory_search").fetchone()[0] == 2
+
+    # The employees_version triggers are live
+    before = conn.execute("SELECT value FROM app_meta WHERE key = 'employees_version'").fetchone()[0]
+    conn.execute("UPDATE employees SET active = 0 WHERE id = 1")
+    conn.commit()
+    assert conn.execute("SELECT value FROM app_meta WHERE key = 'employees_version'").fetchone()[0] == before + 1
+
+
+def test_upgrade_from_intermediate_version(open_db, monkeypatch):
+    conn = open_db()
+    with monkeypatch.context() as patch:
+        patch.setattr(migrations, 'MIGRATIONS', migrations.MIGRATIONS[:3])
+        patch.setattr(migrations, 'SCHEMA_VERSION', 3)
+        assert migrate(conn) == [1, 2, 3]
+
+    assert migrate(conn) == list(range(4, SCHEMA_VERSION + 1))
+    assert get_schema_version(conn) == SCHEMA_VERSION
+
+
+def test_newer_database_is_refused(open_db):
+    conn = open_db()
+    conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION + 1}')
+    with pytest.raises(RuntimeError):
+        migrate(conn)
+
+
+def test_failed_migration_keeps_last_version(open_db, monkeypatch):
+    def broken(cursor):
+        cursor.execute('CREATE TABLE half_done (id INTEGER)')
+        cursor.execute('SELECT * FROM no_such_table')
+
+    monkeypatch.setattr(migrations, 'MIGRATIONS', migrations.MIGRATIONS[:2] + [(3, 'broken', broken)])
+    monkeypatch.setattr(migrations, 'SCHEMA_VERSION', 3)
+    conn = open_db()
+    with pytest.raises(sqlite3.OperationalError):
+        migrate(conn)
+    assert get_schema_version(conn) == 2
+    assert 'half_done' not in table_names(conn)
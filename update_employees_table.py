@@ -1,9 +1,11 @@
 #!/usr/bin/python3
 
-import sqlite3
+import sys
+import time
 import requests
 from dotenv import load_dotenv
 import os
+from db import connect
 
 # Load environment variables
 load_dotenv()
@@ -11,84 +13,117 @@ load_dotenv()
 # API URL from environment variables
 API_URL = os.getenv("API_URL")
 
-# Connect to the database
-def get_db_connection():
-    conn = sqlite3.connect('inventory.db')
-    conn.row_factory = sqlite3.Row
-    return conn
-
-# Function to fetch data from the API
-def fetch_api_data():
-    response = requests.get(API_URL)
-    if response.status_code == 200:
-        return response.json()
-    else:
-        print(f"Failed to fetch data from API. Status Code: {response.status_code}")
-        return []
+# Records requested per page from the directory API (WordPress REST style per_page/page)
+API_PAGE_SIZE = int(os.getenv("API_PAGE_SIZE", "100"))
 
-# Function to update the Employees table
-def update_employees_table(data):
-    conn = get_db_connection()
-    cursor = conn.cursor()
+# (connect, read) timeout in seconds for each page
+API_TIMEOUT = (5, 60)
+
+
+# Function to fetch the directory from the API one page at a time
+# Yields each page's list of records; follows the X-WP-TotalPages header when the API
+# paginates, and treats a response without it as the whole directory.
+# Raises on any failed page so a partial directory never deactivates anyone.
+def fetch_api_pages(url=API_URL, page_size=API_PAGE_SIZE):
+    with requests.Session() as session:
+        page = 1
+        while True:
+            response = session.get(url, params={'per_page': page_size, 'page': page}, timeout=API_TIMEOUT)
+            if response.status_code != 200:
+                raise RuntimeError(f"Failed to fetch page {page} from API. Status Code: {response.status_code}")
 
-    # Fetch all existing employee emails from the database
-    cursor.execute("SELECT email FROM employees")
-    db_emails = {row["email"] for row in cursor.fetchall()}
+            yield response.json()
 
-    # Collect emails and employee details from the API
-    api_emails = set()
-    api_employees = []
+            total_pages = response.headers.get('X-WP-TotalPages')
+            if total_pages is None or page >= int(total_pages):
+                break
+            page += 1
 
-    for employee in data:
+
+# Function to pull (name, email) for staff flagged for AV inventory out of one page of API records
+def parse_api_employees(records):
+    employees = []
+    for employee in records:
         acf = employee.get('acf', {})
         if acf.get('av_inventory') is True:
             name = acf.get('staff_name')
             email = acf.get('email_address')
 
             if name and email:
-                api_emails.add(email)
-                api_employees.append({"name": name, "email": email})
-
-    # Deactivate employees no longer in the API
-    to_deactivate = db_emails - api_emails
-    for email in to_deactivate:
-        cursor.execute(
-            "UPDATE employees SET active = 0 WHERE email = ?",
-            (email,)
-        )
-        print(f"Deactivated employee: {email}")
+                employees.append((name, email))
+    return employees
 
-    # Add or reactivate employees from the API
-    for employee in api_employees:
-        cursor.execute(
-            "SELECT * FROM employees WHERE email = ?",
-            (employee['email'],)
-        )
-        existing_employee = cursor.fetchone()
-
-        if existing_employee:
-            if not existing_employee["active"]:  # Reactivate if previously deactivated
-                cursor.execute(
-                    "UPDATE employees SET active = 1 WHERE email = ?",
-                    (employee['email'],)
-                )
-                print(f"Reactivated employee: {employee['name']} ({employee['email']})")
-        else:
-            # Add new employee to the database
-            cursor.execute(
-                "INSERT INTO employees (name, email, active) VALUES (?, ?, 1)",
-                (employee['name'], employee['email'])
-            )
-            print(f"Added new employee: {employee['name']} ({employee['email']})")
-
-    conn.commit()
-    conn.close()
 
-if __name__ == "__main__":
-    # Fetch data from the API
-    api_data = fetch_api_data()
+# Function to update the Employees table
+# pages is an iterable of lists of API records (e.g. fetch_api_pages()); they are staged in a
+# temp table, then applied with a handful of set-based statements in one short transaction.
+# Returns a summary dict of the emails added, reactivated and deactivated.
+def update_employees_table(pages):
+    conn = connect()
+    cursor = conn.cursor()
+
+    try:
+        # Stage the directory page by page, before taking the write lock: fetching pages is
+        # network time, and scans and checkouts must not wait on it. The temp table is private
+        # to this connection, so staging never locks the database.
+        cursor.execute('CREATE TEMP TABLE api_employees (email TEXT PRIMARY KEY, name TEXT NOT NULL)')
+        for records in pages:
+            cursor.executemany('INSERT OR REPLACE INTO api_employees (name, email) VALUES (?, ?)',
+                               parse_api_employees(records))
+        conn.commit()
+
+        cursor.execute('BEGIN IMMEDIATE')
+        summary = {
+            'deactivated': [row[0] for row in cursor.execute(
+                'SELECT email FROM employees WHERE active != 0 AND email NOT IN (SELECT email FROM api_employees)')],
+            'reactivated': [row[0] for row in cursor.execute(
+                'SELECT email FROM employees WHERE active = 0 AND email IN (SELECT email FROM api_employees)')],
+            'added': [row[0] for row in cursor.execute(
+                'SELECT email FROM api_employees WHERE email NOT IN (SELECT email FROM employees)')],
+        }
+
+        # Deactivate employees no longer in the API
+        cursor.execute('UPDATE employees SET active = 0 WHERE active != 0 AND email NOT IN (SELECT email FROM api_employees)')
+
+        # Reactivate employees who are back in the API
+        cursor.execute('UPDATE employees SET active = 1 WHERE active = 0 AND email IN (SELECT email FROM api_employees)')
+
+        # Add new employees (WHERE true disambiguates the upsert clause after a SELECT)
+        cursor.execute('''
+            INSERT INTO employees (name, email, active)
+            SELECT name, email, 1 FROM api_employees WHERE true
+            ON CONFLICT (email) DO NOTHING
+        ''')
+
+        summary['total'] = cursor.execute('SELECT COUNT(*) FROM api_employees').fetchone()[0]
+        cursor.execute('DROP TABLE api_employees')
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    return summary
 
-    # Update the employees table
-    update_employees_table(api_data)
 
-    print("Employee table update complete.")
+if __name__ == "__main__":
+    start = time.perf_counter()
+
+    # Fetch data from the API and update the employees table
+    try:
+        summary = update_employees_table(fetch_api_pages())
+    except (requests.RequestException, RuntimeError, ValueError) as e:
+        print(f"Employee sync aborted, no changes made: {e}")
+        sys.exit(1)
+
+    for email in summary['added']:
+        print(f"Added new employee: {email}")
+    for email in summary['reactivated']:
+        print(f"Reactivated employee: {email}")
+    for email in summary['deactivated']:
+        print(f"Deactivated employee: {email}")
+
+    print(f"Employee table update complete in {time.perf_counter() - start:.2f}s: "
+          f"{summary['total']} in directory, {len(summary['added'])} added, "
+          f"{len(summary['reactivated'])} reactivated, {len(summary['deactivated'])} deactivated.")